@@ -0,0 +1,242 @@
+import cv2 # 4.10.0.84
+import os # python version
+import threading # python version
+import time # python version
+import numpy as np # 1.26.4
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# opencv-python: 4.10.0.84
+# numpy: 1.26.4
+
+# Background model of one camera that can be re-armed warm between trials.
+# - snapshot(): keeps the converged background image when a trial starts (only a copy, it's on the trigger path)
+# - start_shadow(): seeds the shadow model from the snapshot in a helper thread, called once the stimulus and
+#   the relays have been dispatched (seeding is a full MOG2 apply, tens of ms per camera)
+# - shadow_update(): while recording, the shadow model keeps learning from every shadow_every-th frame at a low rate
+# - rearm(): after the trial the shadow model (or a model seeded from the snapshot) replaces the main model,
+#   and the first fast_frames frames are learned with fast_rate so the model catches up within a few frames
+# - save() / load(): the snapshot is kept on disk, so a restarted session arms from it in a fraction of a second
+#
+# Throttled updates: the background of the arena changes over minutes, so the costly MOG2 update only runs
+# every update_every frames (or at least every update_interval seconds). All other frames are segmented against
+# the frozen background image with absdiff + threshold, which costs a fraction of a MOG2 apply
+# (apply() with learningRate=0 still runs the whole per-pixel mixture and is barely cheaper).
+# The threshold is sqrt(varThreshold) times the noise of the background pixels, measured on every update,
+# and small changes of the mean brightness are compensated. A jump of the mean brightness (lighting change)
+# starts a fast-update phase where every frame is a full MOG2 update again for lighting_frames frames.
+# python bench_detection.py measures the savings and the detection agreement with full updates.
+
+# THE HISTORY PARAMETER SPECIFIES THE NUMBER OF PREVIOUS FRAMES THAT THE ALGORITHM CONSIDERS WHEN UPDATING THE BACKGROUND MODEL.
+# INCREASE varThreshold = LESS SENSITIVE MOTION DETECTION
+history = 400
+var_threshold = 60
+
+# Shadow model: learn from every shadow_every-th frame while recording with shadow_rate
+shadow_every = 10
+shadow_rate = 0.01
+
+# Accelerated learning after re-arming / seeding / lighting changes
+fast_frames = 30
+fast_rate = 0.1
+
+# CHANGE how often the model is updated here (update_every = 1 updates on every frame like before)
+update_every = 8
+# Longest time in seconds between two updates (0 = only update_every)
+update_interval = 0.1
+# Change of the mean brightness (0-255) that counts as a lighting change, and how long to update on every frame after it
+lighting_change = 8
+lighting_frames = 60
+# Smallest threshold of the frozen segmentation (gray levels)
+min_diff_threshold = 10
+
+# CHANGE the folder of the saved background snapshots here
+cache_dir = "background_cache"
+
+# Called by the shadow seeding thread when it starts (Main_code.py sets its scheduling role here)
+on_thread_start = None
+
+
+class BackgroundModel:
+
+    def __init__(self, camera, var_threshold=var_threshold, update_every=update_every):
+        self.camera = camera
+        self.var_threshold = var_threshold
+        self.update_every = update_every
+        self.subtractor = self._create()
+        self.background = None
+        self.shadow = None
+        self._seeding = None
+        self.updates = 0
+        self.frozen = 0
+        self._shadow_count = 0
+        self._fast = 0
+        self._lighting = 0
+        self._since_update = 0
+        self._last_update = 0.0
+        self._frozen_background = None
+        self._threshold = min_diff_threshold
+        self._brightness = None
+        self._frozen_brightness = 0.0
+
+    def _create(self):
+        return cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=self.var_threshold, detectShadows=False)
+
+    # Foreground mask of the frame, updates the model when an update is due
+    def apply(self, frame):
+        self._since_update += 1
+        brightness = cv2.mean(frame[::8, ::8])[0]
+        if self._brightness is not None and abs(brightness - self._brightness) > lighting_change:
+            self._lighting = lighting_frames
+        self._brightness = brightness
+
+        if self._fast > 0:
+            self._fast -= 1
+            return self._update(frame, fast_rate)
+        if self._lighting > 0:
+            self._lighting -= 1
+            return self._update(frame, -1)
+        if (self.update_every <= 1 or self._frozen_background is None
+                or self._frozen_background.shape != frame.shape
+                or self._since_update >= self.update_every
+                or (update_interval and time.perf_counter() - self._last_update > update_interval)):
+            if self.update_every <= 1:
+                return self._update(frame, -1)
+            # Same adaptation per frame as updating every frame with the automatic rate 1 / history
+            return self._update(frame, min(1.0, self._since_update / history))
+
+        # Frozen model: compare with the background image of the last update
+        self.frozen += 1
+        background = self._frozen_background
+        offset = brightness - self._frozen_brightness
+        if offset >= 1:
+            background = cv2.add(background, offset)
+        elif offset <= -1:
+            background = cv2.subtract(background, -offset)
+        diff = cv2.absdiff(frame, background)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        _, fg_mask = cv2.threshold(diff, self._threshold, 255, cv2.THRESH_BINARY)
+        return fg_mask
+
+    def _update(self, frame, rate):
+        self.updates += 1
+        self._since_update = 0
+        self._last_update = time.perf_counter()
+        fg_mask = self.subtractor.apply(frame, learningRate=rate)
+        # During the fast phases every frame is an update, the background image is only needed after them
+        if self.update_every <= 1 or self._fast > 0 or self._lighting > 0:
+            return fg_mask
+
+        # Background image and noise level for the frozen frames until the next update
+        background = self.subtractor.getBackgroundImage()
+        if background is not None and background.shape == frame.shape:
+            self._frozen_background = background
+            self._frozen_brightness = cv2.mean(background[::8, ::8])[0]
+            diff = cv2.absdiff(frame, background)
+            if diff.ndim == 3:
+                diff = diff.max(axis=2)
+            still = fg_mask[::4, ::4] == 0
+            if still.any():
+                noise = float(np.mean(np.square(diff[::4, ::4][still], dtype=np.float32)))
+                self._threshold = max(min_diff_threshold, float(np.sqrt(self.var_threshold * noise)))
+        return fg_mask
+
+    def set_var_threshold(self, value):
+        self.var_threshold = value
+        self.subtractor.setVarThreshold(value)
+        if self.shadow is not None:
+            self.shadow.setVarThreshold(value)
+
+    # Keeps the current background image, the shadow model is seeded from it by start_shadow().
+    # The background image of the last throttled update is reused when it is current, getBackgroundImage() costs ~10 ms
+    def snapshot(self):
+        self._join_seeding()
+        self.shadow = None
+        self._shadow_count = 0
+        background = self._frozen_background
+        if background is None or self.update_every <= 1 or self._fast > 0 or self._lighting > 0:
+            background = self.subtractor.getBackgroundImage()
+        if background is None:
+            return None
+        self.background = background.copy()
+        return self.background
+
+    # Seeds the shadow model from the snapshot in a helper thread
+    def start_shadow(self):
+        if self.background is None or self._seeding is not None:
+            return
+        self._seeding = threading.Thread(target=self._seed_shadow, args=(self.background,),
+                                         name=f"shadow-{self.camera}", daemon=True)
+        self._seeding.start()
+
+    def _seed_shadow(self, image):
+        if on_thread_start is not None:
+            on_thread_start()
+        shadow = self._seeded(image)
+        # The threshold may have changed while seeding
+        shadow.setVarThreshold(self.var_threshold)
+        self.shadow = shadow
+
+    def _join_seeding(self):
+        if self._seeding is not None:
+            self._seeding.join()
+            self._seeding = None
+
+    # Low rate update of the shadow model, called with the frames recorded during a trial.
+    # The frames before the shadow model is seeded are left out
+    def shadow_update(self, frame):
+        if self.shadow is None:
+            return
+        self._shadow_count += 1
+        if self._shadow_count % shadow_every == 0:
+            self.shadow.apply(frame, learningRate=shadow_rate)
+
+    # Replaces the model by the shadow model (or one seeded from the snapshot) and learns fast for a few frames
+    def rearm(self):
+        self._join_seeding()
+        if self.shadow is not None:
+            self.subtractor = self.shadow
+            self.shadow = None
+        elif self.background is not None:
+            self.subtractor = self._seeded(self.background)
+        else:
+            self.subtractor = self._create()
+            self._frozen_background = None
+            return
+        self._frozen_background = None
+        self._fast = fast_frames
+
+    # New model whose background is the given image
+    def _seeded(self, image):
+        subtractor = self._create()
+        # learningRate=1 (re)initializes the model from this image
+        subtractor.apply(image, learningRate=1)
+        return subtractor
+
+    def _path(self):
+        return os.path.join(cache_dir, f"background_{self.camera}.npy")
+
+    # Saves the snapshot (or the current background) to disk
+    def save(self):
+        background = self.background
+        if background is None:
+            background = self.subtractor.getBackgroundImage()
+        if background is None:
+            return False
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(self._path(), background)
+        return True
+
+    # Seeds the model from the snapshot on disk, the frame shape has to match the camera
+    def load(self, shape=None):
+        if not os.path.exists(self._path()):
+            return False
+        background = np.load(self._path())
+        if shape is not None and background.shape[:2] != tuple(shape[:2]):
+            return False
+        self.background = background
+        self.subtractor = self._seeded(background)
+        self._frozen_background = None
+        self._fast = fast_frames
+        return True
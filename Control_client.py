@@ -0,0 +1,68 @@
+import argparse # python version
+import json # python version
+import socket # python version
+import sys # python version
+import Control_server
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# argparse, json, socket, sys: Python version
+
+# Command line client for the control socket of the running rig (Control_server.py)
+# Examples:
+#   python Control_client.py status
+#   python Control_client.py disarm
+#   python Control_client.py set varThreshold=40 min_contour_area=150 speed=1 direction=left
+#   python Control_client.py arm
+
+
+# Sends one command and returns the reply
+def send(request, path=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(5)
+        client.connect(path or Control_server.socket_path)
+        stream = client.makefile(mode='rw')
+        stream.write(json.dumps(request) + "\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+# Turns "key=value" into the right type (numbers, true / false, strings)
+def parse_value(text):
+    if text.lower() in ('true', 'false'):
+        return text.lower() == 'true'
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control the running motion detection rig")
+    parser.add_argument('cmd', choices=['arm', 'disarm', 'set', 'get', 'status'])
+    parser.add_argument('params', nargs='*', help="key=value pairs for set")
+    parser.add_argument('--socket', default=Control_server.socket_path)
+    args = parser.parse_args()
+
+    request = {'cmd': args.cmd}
+    if args.cmd == 'set':
+        if not args.params:
+            parser.error("set needs at least one key=value")
+        request['params'] = {}
+        for pair in args.params:
+            key, _, value = pair.partition('=')
+            request['params'][key] = parse_value(value)
+
+    try:
+        reply = send(request, args.socket)
+    except OSError as error:
+        print(f"Cannot reach the rig on {args.socket}: {error}")
+        sys.exit(1)
+    print(json.dumps(reply, indent=2))
+    sys.exit(0 if reply.get('ok') else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import json # python version
+import math # python version
+import os # python version
+import socket # python version
+import threading # python version
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# json, math, os, socket, threading: Python version
+
+# Local control socket for the running rig (see Control_client.py for the command line client).
+# The server runs in its own thread and listens on a Unix domain socket. Every request and every reply
+# is one JSON object per line:
+#   {"cmd": "arm"}                                  -> start triggering
+#   {"cmd": "disarm"}                               -> stop triggering (capture and background learning keep running)
+#   {"cmd": "set", "params": {"speed": 1, ...}}     -> change parameters
+#   {"cmd": "get"}                                  -> current parameters
+#   {"cmd": "status"}                               -> armed flag, parameters and the state of the main loop
+# Parameter changes are only staged here. The capture loop calls apply_pending() between two frame pairs,
+# which swaps all staged values in at once, so a frame never sees half of a change.
+
+# CHANGE the socket location here
+socket_path = "/tmp/rig_control.sock"
+
+# Parameters that can be changed: type and check of the value
+parameters = {
+    'varThreshold': (float, lambda value: value > 0),
+    'min_contour_area': (float, lambda value: value >= 0),
+    'speed': (int, lambda value: value in (0, 1, 2)),
+    'direction': (str, lambda value: value in ('left', 'right')),
+    'background_white': (bool, lambda value: True),
+    'relay_pause': (float, lambda value: value >= 0),
+    'relay_duration': (float, lambda value: value >= 0),
+    'relay_trigger_delay': (float, lambda value: value >= 0),
+}
+
+# Set when the rig is allowed to trigger
+armed = threading.Event()
+armed.set()
+
+_pending = {}
+_lock = threading.Lock()
+_params = {}
+_status = None
+_thread = None
+_stop = threading.Event()
+# Called by the server thread when it starts (Main_code.py sets its scheduling role here)
+on_thread_start = None
+
+
+# Starts the server thread.
+# params: the parameter dict of the main program, only changed by apply_pending()
+# status: function returning a dict with the state of the main loop for the "status" command
+def start(params, status=None):
+    global _params, _status, _thread
+    _params = params
+    _status = status
+    _stop.clear()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o660)
+    server.listen(1)
+    server.settimeout(0.5)
+    _thread = threading.Thread(target=_serve, args=(server,), name="control-server", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join()
+        _thread = None
+
+
+# Called by the capture loop between two frame pairs, applies all staged changes at once.
+# Returns the changed parameters (empty dict if nothing changed).
+def apply_pending():
+    if not _pending:
+        return {}
+    with _lock:
+        changes = dict(_pending)
+        _pending.clear()
+        _params.update(changes)
+    return changes
+
+
+def _serve(server):
+    if on_thread_start is not None:
+        on_thread_start()
+    with server:
+        while not _stop.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            with connection:
+                connection.settimeout(5)
+                try:
+                    _handle(connection)
+                except Exception:
+                    # One broken client doesn't take the server down
+                    pass
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+
+def _handle(connection):
+    stream = connection.makefile(mode='rw')
+    try:
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    reply = {'ok': False, 'error': "request has to be a JSON object"}
+                else:
+                    reply = _command(request)
+            except Exception as error:
+                # A bad request only gets an error reply, it never stops the server
+                reply = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+            stream.write(json.dumps(reply, default=str) + "\n")
+            stream.flush()
+    except (OSError, socket.timeout):
+        pass
+
+
+def _command(request):
+    cmd = request.get('cmd')
+    if cmd == 'arm':
+        armed.set()
+        return {'ok': True, 'armed': True}
+    elif cmd == 'disarm':
+        armed.clear()
+        return {'ok': True, 'armed': False}
+    elif cmd == 'set':
+        params = request.get('params', {})
+        if not isinstance(params, dict):
+            return {'ok': False, 'error': "params has to be a JSON object"}
+        changes = {}
+        for key, value in params.items():
+            if key not in parameters:
+                return {'ok': False, 'error': f"unknown parameter {key}"}
+            kind, check = parameters[key]
+            if kind is bool and not isinstance(value, bool):
+                return {'ok': False, 'error': f"invalid value for {key}: {value!r}"}
+            # Whole numbers only, 1.7 isn't quietly turned into 1
+            if kind is int and (isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value)):
+                return {'ok': False, 'error': f"invalid value for {key}: {value!r}"}
+            value = kind(value)
+            # inf / nan pass the checks below but break the code using them (Relay_code waits on the relay times)
+            if kind is float and not math.isfinite(value):
+                return {'ok': False, 'error': f"invalid value for {key}: {value!r}"}
+            if not check(value):
+                return {'ok': False, 'error': f"invalid value for {key}: {value!r}"}
+            changes[key] = value
+        with _lock:
+            _pending.update(changes)
+        return {'ok': True, 'pending': changes}
+    elif cmd == 'get':
+        with _lock:
+            return {'ok': True, 'params': dict(_params), 'pending': dict(_pending)}
+    elif cmd == 'status':
+        with _lock:
+            reply = {'ok': True, 'armed': armed.is_set(), 'params': dict(_params), 'pending': dict(_pending)}
+        if _status is not None:
+            reply['state'] = _status()
+        return reply
+    return {'ok': False, 'error': f"unknown command {cmd}"}
@@ -0,0 +1,92 @@
+import json # python version
+import queue # python version
+import threading # python version
+import time # python version
+from datetime import datetime # python version
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# json, queue, threading, time, datetime: Python version
+
+# Asynchronous structured event log.
+# log() only takes the two timestamps and puts the record on a queue, everything else (formatting,
+# JSON encoding, writing the file) happens in a background thread. Every record is one JSON line:
+#   {"event": "trigger", "mono_ns": ..., "wall_ns": ..., "wall": "2024-07-01T13:05:22.123456", ...fields}
+# mono_ns (time.monotonic_ns) is the one to compute intervals with, wall is for humans.
+
+# CHANGE the log file here
+log_path = "event_log.jsonl"
+
+# Also print a short line for every event on the console (from the background thread)
+echo = True
+
+# Called by the writer thread when it starts (Main_code.py sets its scheduling role here)
+on_thread_start = None
+
+_queue = queue.SimpleQueue()
+_thread = None
+_stop = object()
+
+
+# Puts an event on the queue, this is the only part that runs in the calling thread
+def log(event, **fields):
+    _queue.put((time.monotonic_ns(), time.time_ns(), event, fields))
+
+
+# Starts the background writer thread
+def start(path=None):
+    global _thread, log_path
+    if _thread is not None and _thread.is_alive():
+        return
+    if path is not None:
+        log_path = path
+    _thread = threading.Thread(target=_writer, name="event-log", daemon=True)
+    _thread.start()
+
+
+# Writes everything still on the queue and stops the writer thread
+def stop():
+    global _thread
+    if _thread is None:
+        return
+    _queue.put(_stop)
+    _thread.join()
+    _thread = None
+
+
+# Converts numpy scalars / arrays and other objects JSON doesn't know
+def _default(value):
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _writer():
+    if on_thread_start is not None:
+        on_thread_start()
+    with open(log_path, mode='a') as file:
+        while True:
+            record = _queue.get()
+            batch = [record]
+            # Write everything that is already waiting in one go
+            while True:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            done = False
+            for record in batch:
+                if record is _stop:
+                    done = True
+                    continue
+                mono_ns, wall_ns, event, fields = record
+                line = {'event': event, 'mono_ns': mono_ns, 'wall_ns': wall_ns,
+                        'wall': datetime.fromtimestamp(wall_ns / 1e9).isoformat(timespec='microseconds')}
+                line.update(fields)
+                file.write(json.dumps(line, default=_default) + "\n")
+                if echo:
+                    print(f"[{line['wall'][11:]}] {event} " + " ".join(f"{key}={value}" for key, value in fields.items()))
+            file.flush()
+            if done:
+                return
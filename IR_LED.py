@@ -1,23 +1,278 @@
-import digitalio # 0.55
+import time # python version
+import threading # python version
+import heapq # python version
 
+# digitalio (0.55) is imported when the pins are used, so importing this file doesn't open the GPIO board
 'C0', 'C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'D4', 'D5', 'D6', 'D7'
 
+# LED bank of the pins passed to init(), used by LED_on / LED_off
+bank = None
+
 def init(pins):
-    for pin in pins:
-        GPIO = digitalio.DigitalInOut(pin)
-        GPIO.direction = digitalio.Direction.OUTPUT
-        GPIO.value = False
-    
-    
+    global bank
+    if bank is not None and len(bank.pins) == len(pins) and all(a is b for a, b in zip(bank.pins, pins)):
+        bank.all_off()
+        return
+    bank = LEDBank(pins)
+
+
 def LED_on (pin):
+    if bank is not None and bank.has(pin):
+        bank.set([(pin, True)])
+        return
+    import digitalio # 0.55
     GPIO = digitalio.DigitalInOut(pin)
     GPIO.direction = digitalio.Direction.OUTPUT
-    GPIO.value = True 
+    GPIO.value = True
 
 def LED_off (pin):
+    if bank is not None and bank.has(pin):
+        bank.set([(pin, False)])
+        return
+    import digitalio # 0.55
     GPIO = digitalio.DigitalInOut(pin)
     GPIO.direction = digitalio.Direction.OUTPUT
-    GPIO.value = False 
+    GPIO.value = False
+
+# Several pins at once: changes is a list of (pin, True / False), one port write with the LED bank
+def LED_set (changes):
+    if bank is not None and all(bank.has(pin) for pin, _ in changes):
+        bank.set(changes)
+        return
+    for pin, value in changes:
+        if value:
+            LED_on(pin)
+        else:
+            LED_off(pin)
+
+
+# The pins of one board, opened once.
+# The bank remembers the state of every pin and skips writes that wouldn't change anything.
+# On the FT232H (Blinka's MPSSE pins) all changes of one set() call go out as a single port write,
+# instead of a read + write per pin. Other backends get one write per changed pin.
+# transactions counts the writes the bank sent to the board.
+class LEDBank:
+
+    def __init__(self, pins):
+        import digitalio # 0.55
+        self.pins = list(pins)
+        self.state = [False] * len(self.pins)
+        self.transactions = 0
+        self._index = {id(pin): index for index, pin in enumerate(self.pins)}
+        self._lock = threading.Lock()
+
+        # Every pin is opened and set to output once
+        self.outputs = []
+        for pin in self.pins:
+            GPIO = digitalio.DigitalInOut(pin)
+            GPIO.direction = digitalio.Direction.OUTPUT
+            self.outputs.append(GPIO)
+
+        self.port = port_controller(self.pins)
+        if self.port is not None:
+            self._bits = [1 << pin.id for pin in self.pins]
+            # Output state of the pins that aren't in the bank, read once
+            state = self.port.read(with_output=True)
+            self._port_state = state if isinstance(state, int) else state[0]
+            self.transactions += 1
+        self._write(range(len(self.pins)), force=True)
+
+    def has(self, pin):
+        return id(pin) in self._index
+
+    # changes: list of (pin, True / False). Returns the number of writes sent to the board.
+    # (Blinka's pins define __eq__ without __hash__, so they can't be dict keys)
+    def set(self, changes):
+        with self._lock:
+            changed = []
+            for pin, value in changes:
+                index = self._index[id(pin)]
+                if self.state[index] != bool(value):
+                    self.state[index] = bool(value)
+                    changed.append(index)
+            if not changed:
+                return 0
+            return self._write(changed)
+
+    def on(self, pin):
+        return self.set([(pin, True)])
+
+    def off(self, pin):
+        return self.set([(pin, False)])
+
+    def all_off(self):
+        return self.set([(pin, False) for pin in self.pins])
+
+    def _write(self, indices, force=False):
+        if force:
+            self.state = [False] * len(self.pins)
+        if self.port is not None:
+            for index in indices:
+                if self.state[index]:
+                    self._port_state |= self._bits[index]
+                else:
+                    self._port_state &= ~self._bits[index]
+            self.port.write(self._port_state & self.port.direction)
+            self.transactions += 1
+            return 1
+        for index in indices:
+            self.outputs[index].value = self.state[index]
+            self.transactions += 1
+        return len(indices)
+
+
+# GPIO controller of the pins if they all share one that can write the whole port (Blinka's FT232H / MPSSE pins)
+def port_controller(pins):
+    controllers = set()
+    for pin in pins:
+        controller = getattr(type(pin), 'mpsse_gpio', None) or getattr(type(pin), 'ft232h_gpio', None)
+        if controller is None or not hasattr(pin, 'id'):
+            return None
+        controllers.add(id(controller))
+    if len(controllers) != 1:
+        return None
+    return controller
+
+
+# Sync pulse on a fixed set of pins (pattern["MD"] in Main_code.py) when the software decides to trigger.
+# The pins go through the LED bank opened by init(), so emit() is a single port write. The pins go high in
+# emit() and low again in release() once width seconds have passed, which the capture loop calls every frame
+# pair, so the capture thread never waits for the end of the pulse.
+class SyncPulse:
+
+    def __init__(self, pins, width=0.002):
+        if bank is None or not all(bank.has(pin) for pin in pins):
+            raise ValueError("SyncPulse pins have to be initialized with IR_LED.init() first")
+        self.pins = list(pins)
+        self.width = width
+        self.high_since = None
+
+    # Sets the pins high, returns time.monotonic_ns() before and after the write
+    def emit(self):
+        start = time.monotonic_ns()
+        bank.set([(pin, True) for pin in self.pins])
+        self.high_since = time.monotonic()
+        return start, time.monotonic_ns()
+
+    # Sets the pins low again once the pulse is long enough
+    def release(self):
+        if self.high_since is None or time.monotonic() - self.high_since < self.width:
+            return
+        bank.set([(pin, False) for pin in self.pins])
+        self.high_since = None
+
+
+# Called by the worker thread of a CommandQueue when it starts (Main_code.py sets its scheduling role here)
+on_thread_start = None
+
+# Timed GPIO commands: a worker thread sets the pins at the requested time, so the stimulus loop only
+# queues "set these pins at time T" and never waits for the USB write.
+# Times are time.monotonic(). Every executed command is kept with its planned and actual time in executed.
+class CommandQueue:
+
+    # The worker sleeps until spin before the deadline and spins for the rest
+    spin = 0.001
+
+    def __init__(self):
+        self._heap = []
+        self._count = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._busy = False
+        self._thread = None
+        self.executed = []
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name="gpio", daemon=True)
+        self._thread.start()
+
+    # Runs the commands still queued and stops the worker
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # changes: list of (pin, True / False) to set at time.monotonic() t (None = as soon as possible)
+    def at(self, t, changes):
+        if t is None:
+            t = time.monotonic()
+        with self._condition:
+            # The counter keeps commands with the same time in order (and the pins out of the comparison)
+            heapq.heappush(self._heap, (t, self._count, list(changes)))
+            self._count += 1
+            self._condition.notify()
+
+    def now(self, changes):
+        self.at(None, changes)
+
+    # Drops the commands that haven't run yet
+    def clear(self):
+        with self._condition:
+            self._heap = []
+
+    # Waits until every queued command has run
+    def flush(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while (self._heap or self._busy) and time.monotonic() < deadline:
+                self._condition.wait(0.001)
+
+    # Returns and forgets the executed commands: dicts with planned, actual (time.monotonic()), lag and writes
+    def pop_executed(self):
+        with self._condition:
+            executed, self.executed = self.executed, []
+        return executed
+
+    def _worker(self):
+        if on_thread_start is not None:
+            on_thread_start()
+        with self._condition:
+            while True:
+                if not self._heap:
+                    if not self._running:
+                        break
+                    self._condition.wait()
+                    continue
+                planned = self._heap[0][0]
+                remaining = planned - time.monotonic()
+                if remaining > self.spin and self._running:
+                    # Woken early by a new (maybe earlier) command or stop()
+                    self._condition.wait(remaining - self.spin)
+                    continue
+                planned, _, changes = heapq.heappop(self._heap)
+                self._busy = True
+                self._condition.release()
+                try:
+                    while time.monotonic() < planned:
+                        pass
+                    actual = time.monotonic()
+                    writes = _set(changes)
+                finally:
+                    self._condition.acquire()
+                    self._busy = False
+                self.executed.append({'planned': planned, 'actual': actual, 'lag': actual - planned, 'writes': writes})
+                self._condition.notify_all()
+
+
+def _set(changes):
+    if bank is not None and all(bank.has(pin) for pin, _ in changes):
+        return bank.set(changes)
+    LED_set(changes)
+    return len(changes)
 
 
+# Command queue used by the stimulus, started by start_queue()
+queue = None
 
+def start_queue():
+    global queue
+    if queue is None:
+        queue = CommandQueue()
+    queue.start()
+    return queue
@@ -11,7 +11,16 @@ import IR_LED
 import Relay_code
 import pygame # 2.6.0
 import threading
-import board # 8.47
+import json
+import QoS_watchdog
+import Background_model
+import Motion_tracker
+import Sched_profile
+import Event_log
+import Control_server
+import Stim_process
+import Stim_renderer
+from concurrent.futures import ThreadPoolExecutor
 
 # OS Version: Ubuntu 22.04.4
 # Python: 3.10.12
@@ -27,25 +36,24 @@ import board # 8.47
 # Camera serial number can be found by launching SpinView with cameras plugged in.
 serial_number_0 = "24122966"  # primary camera serial number
 serial_number_1 = "24122965"  # secondary camera serial number
-cap = EasyPySpin.SynchronizedVideoCapture(serial_number_0, serial_number_1)
+# Opened by init_camera() at startup, importing this file doesn't touch any hardware
+cap = None
 
 # CAMERA FPS
 # When you change the camera fps, make sure to also change the fps in the VideoWriter as well.
 frame_rate = 226
 
-cap.set(cv2.CAP_PROP_FPS, frame_rate)
-
 # CAMERA RESOLUTION WIDTH
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1440)
+camera_width = 1440
 
 # CAMERA RESOLUTION HEIGHT
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+camera_height = 1080
 
 # CAMERA EXPOSURE TIME (MICROSECONDS)
-cap.set(cv2.CAP_PROP_EXPOSURE, 4000)
+exposure = 4000
 
 # CAMERA GAIN
-cap.set(cv2.CAP_PROP_GAIN, 0)
+gain = 0
 
 # NOTE: you can find all camera properties you can change in Python in the "Supported VideoCapture Properties" section of this git repo: https://github.com/elerac/EasyPySpin. If there are properties you can't find on that page, you can configure those properties using the SpinView application.
 # You can confirm the changes that you made to the camera by printing out the camera properties like so, replace XXX with the property:
@@ -57,6 +65,28 @@ buffer_size = 180
 # The amount of the system will wait before starting the visual stimulus 
 wait_time = 1
 
+# MULTI-OBJECT MODE
+# True: keep every blob above min_contour_area and track them all (Motion_tracker.MultiTracker), the trigger follows
+# the track chosen by Motion_tracker.selection. False: only the largest contour like before
+multi_object = True
+
+# PREDICTIVE TRIGGER
+# The stimulus is timed so the bar appears when the animal reaches target_x (pixels, per camera),
+# using the velocity of the trackers and the pipeline latency = fixed_latency + software_latency.
+# predictive_trigger = False starts the stimulus right away like before
+predictive_trigger = True
+target_x = [720, 720]
+# Longest time the stimulus is held back for a predicted crossing (seconds)
+max_lead = 1.0
+# CHANGE to the measured latency of the hardware (seconds): camera exposure and transfer until cap.read() returns,
+# detection, and the display from the flip until the bar is lit. Measure it end to end, for example with a photodiode
+# on the stimulus display recorded next to the pattern["MD"] pulse, minus the software_latency logged for that trial
+fixed_latency = 0.03
+# Delay between starting the animation and its first bar frame being flipped, updated after every stimulus (seconds)
+software_latency = 0.0
+# How long after the predicted crossing the actual crossing is looked for in camera 0 (seconds)
+crossing_timeout = 0.5
+
 # Duration: How long the animation should last
 # Initial: 6 seconds  
 duration = 6
@@ -93,8 +123,20 @@ color_selected = red
 
 # Setting the trigger event
 stimulus_event = threading.Event()
+# Longest time the idle stimulus thread sleeps between two looks at the window events (seconds)
+idle_timeout = 0.1
+# True: the stimulus runs in its own process (Stim_process.py) instead of a thread, so drawing and detection don't
+# share the GIL. Triggers go over a pipe, the LED changes of the frames come back and are switched here
+stimulus_process = False
+# Stim_process.StimulusProcess while stimulus_process is used
+stim_process = None
+# Stimulus renderer: 'surface' (pygame display surface, dirty rectangles) or 'texture' (SDL2 renderer, Stim_renderer.py,
+# uses the GPU when there is one and SDL's software renderer otherwise). frame_stats in the event log has the CPU time per frame
+stimulus_backend = 'surface'
 running_flag = threading.Event()
 starting_event = threading.Event()
+# Set by the stimulus thread once the display is open
+display_ready = threading.Event()
 
 # Pins for the IR LEDs
 # 0 & 1 = Solenoid #1
@@ -103,17 +145,49 @@ starting_event = threading.Event()
 # 5 & 9 = Speed
 # 6, 7, 10, 11 = unused 
 # pins = [ 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11 ]
-pins = [board.C3, board.C2, board.C1, board.C0, board.C7, board.C6, board.C5, board.C4, board.D7, board.D6, board.D5, board.D4]
-
-# CHANGE the pattern for the lights here by replacing the pins[#]
-pattern = {"Left": pins[4], "Right": pins[8], "Speed": [pins[5], pins[9]], "MD": [pins[10], pins[11]]}
+# Set by init_pins() at startup (importing board opens the GPIO board)
+pins = None
+pattern = None
+# Pulse on the pattern["MD"] pins when motion is detected
+md_pulse = None
+
+def init_pins():
+    global pins, pattern, md_pulse
+    import board # 8.47
+    pins = [board.C3, board.C2, board.C1, board.C0, board.C7, board.C6, board.C5, board.C4, board.D7, board.D6, board.D5, board.D4]
+
+    # CHANGE the pattern for the lights here by replacing the pins[#]
+    pattern = {"Left": pins[4], "Right": pins[8], "Speed": [pins[5], pins[9]], "MD": [pins[10], pins[11]]}
+    IR_LED.init(pins)
+    md_pulse = IR_LED.SyncPulse(pattern["MD"])
 
 # CHANGE solenoid settings
-# relay_pause: How long until turning one the first relay
+# relay_pause: How long until turning one the first relay (free mode)
 # relay_duration: How long the relay will stay on 
+# relay_trigger_delay: How long after the motion trigger the first relay turns on (trigger mode, replaces relay_pause)
 relay_pause = 5
 relay_duration = 2
+relay_trigger_delay = 0.5
 start = True
+# relay_mode: 'free' cycles the relays on their own timer (the behaviour of the rig so far), 'trigger' switches them
+# relative to each motion trigger (Relay_code.trigger_timeline: relay 1 on relay_trigger_delay after the trigger, then
+# relay 2 like in the free cycle), so every recorded trial contains the relay action. CHANGE to 'trigger' for that.
+# The switches are in the event log ('relay'), the trial metadata has them with the relay settings of the trial.
+relay_mode = 'free'
+
+# Parameters that can be changed while running through the control socket (python Control_client.py set key=value)
+params = {
+    'varThreshold': 60,
+    'min_contour_area': 100,
+    'speed': speed,
+    'direction': direction,
+    'background_white': background_white,
+    'relay_pause': relay_pause,
+    'relay_duration': relay_duration,
+    'relay_trigger_delay': relay_trigger_delay,
+}
+# Stimulus parameters of the current trigger, copied from params right before the stimulus is started
+stimulus_params = dict(params)
 
 # Camera settings
 fourcc = cv2.VideoWriter_fourcc(*'XVID')
@@ -121,99 +195,370 @@ additional_frames_0 = deque(maxlen=additional_frame_size)
 additional_frames_1 = deque(maxlen=additional_frame_size)
 ring_buffer_0 = deque(maxlen=buffer_size)
 ring_buffer_1 = deque(maxlen=buffer_size)
-print(cap.get(cv2.CAP_PROP_EXPOSURE))
-print(cap.get(cv2.CAP_PROP_GAIN))
+
+# STARTUP READINESS CHECKS
+# The cameras are streaming once streaming_frames frame pairs in a row were read
+streaming_frames = 10
+# The background model has converged once less than converged_fraction of the pixels are foreground
+# for converged_frames frame pairs in a row
+converged_fraction = 0.001
+converged_frames = 30
+# Longest time to wait for each device, the rig arms anyway (with a warning in the event log) after that
+startup_timeout = 10
+
+# Opens both cameras, applies the camera settings and waits until they are streaming
+def init_camera():
+    global cap
+    cap = EasyPySpin.SynchronizedVideoCapture(serial_number_0, serial_number_1)
+    cap.set(cv2.CAP_PROP_FPS, frame_rate)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, camera_width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, camera_height)
+    cap.set(cv2.CAP_PROP_EXPOSURE, exposure)
+    cap.set(cv2.CAP_PROP_GAIN, gain)
+    Event_log.log('camera', fps=cap.get(cv2.CAP_PROP_FPS), exposure=cap.get(cv2.CAP_PROP_EXPOSURE), gain=cap.get(cv2.CAP_PROP_GAIN))
+
+    streaming = 0
+    start = time.monotonic()
+    while streaming < streaming_frames and time.monotonic() - start < startup_timeout:
+        if all(ret for ret, _ in cap.read()):
+            streaming += 1
+        else:
+            streaming = 0
+    if streaming < streaming_frames:
+        Event_log.log('startup_warning', device='camera', reason='not streaming')
 
 # The function that initializes the visual stimulus
 def init_vis_stim():
     # Setup
     # CHANGE DISPLAY TO 0 FOR MAIN MONITOR
+    Sched_profile.apply_role('stimulus')
     pygame.init()
-    screen = pygame.display.set_mode((width, height), flags=pygame.NOFRAME, display=1)
+    if stimulus_backend == 'texture':
+        screen = Stim_renderer.TextureScreen(width, height, display=1)
+    else:
+        screen = pygame.display.set_mode((width, height), flags=pygame.NOFRAME, display=1)
+    # Every stimulus is compiled (or loaded from stimulus_cache/) and the backgrounds are drawn before arming
+    Visual_Stimulus_One_Bar.prepare(duration, height, width, color_selected, screen, display=1)
+    display_ready.set()
+    # The idle screen shows the background of the next stimulus, drawn once. The thread then sleeps on
+    # stimulus_event and wakes up right away on a trigger (or every idle_timeout for window events and
+    # background changes), instead of redrawing in a loop.
+    Visual_Stimulus_One_Bar.show_background(params['background_white'], screen, height, width)
     while running_flag.is_set():
+        if stimulus_event.wait(idle_timeout):
+            Stim_process.wait_until(stimulus_params.get('onset_at'))
+            start = time.monotonic()
+            Visual_Stimulus_One_Bar.animation(duration, stimulus_params['speed'], stimulus_params['direction'], height, width, color_selected, stimulus_params['background_white'], screen, pins, wait_time, pattern)
+            stimulus_event.clear() 
+            stimulus_done(start, Visual_Stimulus_One_Bar.onset_time, Visual_Stimulus_One_Bar.frame_stats)
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running_flag.clear()
-        
-        # Check to start stimulus animation
-        if stimulus_event.is_set():
-            Visual_Stimulus_One_Bar.animation(duration, speed, direction, height, width, color_selected, background_white, screen, pins, wait_time, pattern)
-            stimulus_event.clear() 
-
-        Visual_Stimulus_One_Bar.draw_background(background_white, screen, height, width)
-        pygame.display.flip()
+        # Only draws when the background setting changed
+        Visual_Stimulus_One_Bar.show_background(params['background_white'], screen, height, width)
     pygame.quit()
 
+# End of a stimulus (in this thread or the stimulus process): latency, frame stats and the LED changes it switched
+def stimulus_done(start, onset, frames):
+    measure_latency(start, onset)
+    Event_log.log('stimulus_frames', **frames)
+    for command in IR_LED.queue.pop_executed():
+        Event_log.log('led', planned=command['planned'], actual=command['actual'],
+                      lag_us=round(command['lag'] * 1e6, 1), writes=command['writes'])
+
+# Updates the software part of the latency with the delay between starting the animation and its first bar frame
+def measure_latency(start, onset):
+    global software_latency
+    if onset is None:
+        return
+    latency = onset - start
+    software_latency += 0.3 * (latency - software_latency)
+    Event_log.log('stimulus_onset', scheduled=stimulus_params.get('onset_at'), started=start, onset=onset,
+                  latency=round(latency, 4), software_latency=round(software_latency, 4),
+                  pipeline_latency=round(pipeline_latency(), 4))
+
+# Time from the motion in front of the cameras to the bar on the display: fixed hardware part + measured software part
+def pipeline_latency():
+    return fixed_latency + software_latency
+
+# When the stimulus should start: predicted crossing of target_x minus the pipeline latency,
+# never later than max_lead. Returns (start time, predicted crossing time), both time.monotonic()
+def schedule_stimulus(trackers, now):
+    if not predictive_trigger:
+        return None, None
+    crossings = [tracker.crossing_time(target_x[i]) for i, tracker in enumerate(trackers)]
+    crossings = [crossing for crossing in crossings if crossing is not None]
+    if not crossings:
+        return None, None
+    crossing = sum(crossings) / len(crossings)
+    onset_at = min(max(crossing - pipeline_latency(), now), now + max_lead)
+    return onset_at, crossing
+
+# Stimulus in its own process: starts it and handles the end of every stimulus (replaces init_vis_stim)
+def run_stim_process():
+    global stim_process
+    # Only waits for the end of the stimuli, the stimulus itself runs in the other process
+    Sched_profile.apply_role('helper')
+    settings = {'width': width, 'height': height, 'duration': duration, 'color': color_selected, 'display': 1,
+                'background_white': params['background_white'], 'role': 'stimulus', 'backend': stimulus_backend}
+    stim_process = Stim_process.StimulusProcess(settings, on_leds=switch_leds)
+    stim_process.start()
+    if stim_process.ready.wait(startup_timeout):
+        display_ready.set()
+    while running_flag.is_set():
+        result = stim_process.wait_done(idle_timeout)
+        if result is None:
+            continue
+        stim_process.done.clear()
+        stimulus_event.clear()
+        stimulus_done(result['started'], result['onset'], result['frames'])
+    stim_process.stop()
+
+# LED changes sent back by the stimulus process, switched at the flip time of their frame
+def switch_leds(t, changes):
+    if pins is None:
+        return
+    led_pins = Visual_Stimulus_One_Bar.led_pins_of(pins, pattern)
+    IR_LED.start_queue().at(t, [(led_pins[name], value) for name, value in changes])
+
 # The function that initializes the relay 
 def init_relay():
-    Relay_code.Start(relay_pause, relay_duration, True)
-
-# The function that detects motion 
-def detect_motion(frame, back_sub, kernel, min_contour_area, i):
-
-    fg_mask = back_sub.apply(frame)
+    Sched_profile.apply_role('relay')
+    Relay_code.on_switch = lambda record: Event_log.log('relay', **record)
+    # startup() has reset the stop request already, a stop requested before this thread got here still counts
+    Relay_code.Start(relay_pause, relay_duration, True, relay_mode, clear=False, delay=relay_trigger_delay)
+
+# Foreground mask of a frame, closed, median filtered and thresholded, downscaled by scale.
+# The background model always gets the full resolution frame: MOG2 starts over when the frame size
+# changes, so only the mask is downscaled (and the closing kernel with it)
+def foreground_mask(frame, model, kernel, scale=1.0):
+    fg_mask = model.apply(frame)
+    if scale != 1.0:
+        fg_mask = cv2.resize(fg_mask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        kernel = kernel[:max(1, int(kernel.shape[0] * scale)), :max(1, int(kernel.shape[1] * scale))]
     fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
     fg_mask = cv2.medianBlur(fg_mask, 5)
     _, fg_mask = cv2.threshold(fg_mask, 127, 255, cv2.THRESH_BINARY)
+    return fg_mask
+
+# The function that detects motion 
+# scale: the foreground mask is cleaned up and searched for contours downscaled by this factor (set by the QoS watchdog),
+# the model is updated at full resolution and the contour is returned in full resolution
+# show: whether the preview window should be refreshed on this frame
+def detect_motion(frame, model, kernel, min_contour_area, i, scale=1.0, show=True):
+
+    preview = frame
+    fg_mask = foreground_mask(frame, model, kernel, scale)
+    # The mask is downscaled, so is the area of a contour
+    min_contour_area = min_contour_area * scale * scale
 
     contours, _ = cv2.findContours(fg_mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
     areas = [cv2.contourArea(c) for c in contours]
 
     if len(areas) == 0:
-        cv2.imshow(f"frame-{i}", frame)
-        if cv2.waitKey(1) == ord('q'):
-            return None
+        if show:
+            cv2.imshow(f"frame-{i}", preview)
+            if cv2.waitKey(1) == ord('q'):
+                return None
     else:
         max_index = np.argmax(areas)
         if areas[max_index] > min_contour_area:
+            if scale != 1.0:
+                return (contours[max_index] / scale).astype(np.int32)
             return contours[max_index]
     return None
 
+# Feeds frames into the background models of both cameras until they have converged (see the readiness checks at the top)
+def wait_for_background(models):
+    still = 0
+    start = time.monotonic()
+    while still < converged_frames and time.monotonic() - start < startup_timeout:
+        fractions = []
+        for i, (ret, frame) in enumerate(cap.read()):
+            if ret:
+                fg_mask = models[i].apply(frame)
+                fractions.append(cv2.countNonZero(fg_mask) / fg_mask.size)
+        if fractions and max(fractions) < converged_fraction:
+            still += 1
+        else:
+            still = 0
+    if still < converged_frames:
+        Event_log.log('startup_warning', device='background', reason='not converged')
+    return time.monotonic() - start
+
+# Brings up the cameras, display, relay and GPIO at the same time and waits until each of them is ready.
+# threads: list of the caller, every thread started here is added to it right away, so the caller can stop and
+# join them even when startup() fails half way. Returns how long each part took.
+def startup(threads):
+    start = time.monotonic()
+    timings = {}
+
+    def timed(name, function):
+        function()
+        timings[name] = round(time.monotonic() - start, 3)
+
+    running_flag.set()
+    Relay_code.reset()
+    for target in (init_relay, run_stim_process if stimulus_process else init_vis_stim):
+        thread = threading.Thread(target=target)
+        thread.start()
+        threads.append(thread)
+    with ThreadPoolExecutor(max_workers=2, initializer=Sched_profile.apply_role, initargs=('helper',)) as pool:
+        camera = pool.submit(timed, 'camera', init_camera)
+        gpio = pool.submit(timed, 'gpio', init_pins)
+        camera.result()
+        gpio.result()
+
+    for name, ready in (('display', display_ready), ('relay', Relay_code.ready)):
+        if ready.wait(max(0, startup_timeout - (time.monotonic() - start))):
+            timings[name] = round(time.monotonic() - start, 3)
+        else:
+            Event_log.log('startup_warning', device=name, reason='not ready')
+    return timings
+
+# Multi-object mode of detect_motion(): all blobs above min_contour_area instead of the largest contour.
+# Returns the centroids (N x 2), areas (N) and bounding boxes (N x 4: x, y, w, h) in full resolution.
+def detect_blobs(frame, model, kernel, min_contour_area, i, scale=1.0, show=True):
+
+    preview = frame
+    fg_mask = foreground_mask(frame, model, kernel, scale)
+    # The mask is downscaled, so is the area of a contour
+    min_contour_area = min_contour_area * scale * scale
+
+    # Label 0 is the background
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(fg_mask)
+    keep = stats[1:, cv2.CC_STAT_AREA] > min_contour_area
+    areas = stats[1:, cv2.CC_STAT_AREA][keep] / (scale * scale)
+    boxes = (stats[1:, :4][keep] / scale).astype(np.int32)
+    centroids = centroids[1:][keep] / scale
+
+    if len(areas) == 0 and show:
+        cv2.imshow(f"frame-{i}", preview)
+        cv2.waitKey(1)
+    return centroids, areas, boxes
+
+# Writes the metadata of a trial next to the saved frames
+def write_trial_metadata(folder, metadata):
+    with open(os.path.join(folder, 'trial_metadata.json'), mode='w') as file:
+        json.dump(metadata, file, indent=2)
+
 # the main function of motion detection 
 def motion_detection():
+    startup_start = time.monotonic()
+    # Relay and stimulus threads, joined at the end
+    threads = []
     try:
-        # Start the thread for the relay, visual stimulus and IR LEDs
-        running_flag.set() 
-        relay_thread = threading.Thread(target=init_relay)
-        relay_thread.start()  
-        stim_thread= threading.Thread(target=init_vis_stim)
-        stim_thread.start()
-        IR_LED.init(pins)
-        print("Starting motion detection. Press Ctrl+C to stop.")
-        sleep(5)
-
-        prev_x = None
+        # The helper threads leave the capture core and SCHED_FIFO of the capture thread (see Sched_profile.py)
+        for module in (Event_log, Control_server, Stim_process, Background_model):
+            module.on_thread_start = lambda: Sched_profile.apply_role('helper')
+        IR_LED.on_thread_start = lambda: Sched_profile.apply_role('gpio')
+        Event_log.start()
+
+        # Apply the CPU affinity / real-time scheduling profile (see Sched_profile.py)
+        Sched_profile.apply_memory_lock()
+        Sched_profile.apply_opencv(cv2)
+        Sched_profile.apply_role('capture')
+
+        # Start the cameras, relay, visual stimulus and IR LEDs
+        timings = startup(threads)
+        Sched_profile.report()
+
         recording = False
         frame_counter = 0
-        is_motion_detected_0 = False
-        is_motion_detected_1 = False
-
-        # THE HISTORY PARAMETER SPECIFIES THE NUMBER OF PREVIOUS FRAMES THAT THE ALGORITHM CONSIDERS WHEN UPDATING THE BACKGROUND MODEL.
-        # INCREASE history = SLOWER ADAPTATION TO CHANGES, LESS SENSITIVE TO SUDDEN OR SHORT-TERM CHANGES IN THE FRAME.
+        # Number of frames read from each camera
+        frame_index = [0, 0]
+        # Position and velocity of the motion in each camera
+        trackers = [Motion_tracker.Tracker(i) for i in range(2)]
+        multi_trackers = [Motion_tracker.MultiTracker(i) for i in range(2)]
+        # Predicted crossing of target_x that is still being checked in camera 0
+        crossing = None
+
+        # One background model per camera (history and learning rates in Background_model.py)
         # INCREASE varThreshold = LESS SENSITIVE MOTION DETECTION
-        back_sub = cv2.createBackgroundSubtractorMOG2(history=400, varThreshold=60, detectShadows=False)
+        # A background saved by the previous session is used as a starting point, so the models converge within a few frames
+        models = [Background_model.BackgroundModel(i, params['varThreshold']) for i in range(2)]
+        for model in models:
+            model.load((camera_height, camera_width))
         # INCREASE KERNEL SIZE FOR MORE AGGRESSIVE NOISE REDUCTION
         kernel = np.ones((30, 30), np.uint8)
         # DETERMINES THE CONTOUR SIZE TO BE CONSIDERED AS VALID MOTION
         # Example: ONLY CONTOURS WITH AN AREA OF 100 PIXELS OR MORE WILL BE CONSIDERED AS VALID MOTION.
-        min_contour_area = 100
+        # CHANGE varThreshold and min_contour_area in params at the top of the file
+
+        # Arm once the background model has converged instead of waiting a fixed time
+        timings['background'] = round(wait_for_background(models), 3)
+        time_to_armed = time.monotonic() - startup_start
+        Event_log.log('armed', time_to_armed=round(time_to_armed, 3), **timings)
+        print(f"Armed after {time_to_armed:.2f} s. Starting motion detection. Press Ctrl+C to stop.")
+
+        # Steps down preview, detection resolution and detection rate when the loop can't keep up with the cameras
+        watchdog = QoS_watchdog.Watchdog(cap.get(cv2.CAP_PROP_FPS))
+        trials = 0
+
+        # State of the loop for the "status" command of the control socket
+        def status():
+            return {'recording': recording, 'trials': trials, 'frame_0': frame_index[0], 'frame_1': frame_index[1], 'qos': watchdog.summary()}
+
+        Control_server.start(params, status)
 
         # The loop to check for motion detection in each camera (Please don't change unless it is necessary)
         while True:
             read_values = cap.read()
+            frame_time = time.monotonic()
+            watchdog.begin()
+            if md_pulse is not None:
+                md_pulse.release()
+
+            # Parameter changes from the control socket are applied here, between two frame pairs
+            changes = Control_server.apply_pending()
+            if changes:
+                if 'varThreshold' in changes:
+                    for model in models:
+                        model.set_var_threshold(params['varThreshold'])
+                if 'background_white' in changes and stim_process is not None:
+                    stim_process.set_background(params['background_white'])
+                if {'relay_pause', 'relay_duration', 'relay_trigger_delay'} & changes.keys():
+                    Relay_code.set_timing(params['relay_pause'], params['relay_duration'], params['relay_trigger_delay'])
+                Event_log.log('params', **changes)
+
+            show = watchdog.show_preview(recording)
+            detect = watchdog.run_detection()
             for i, (ret, frame) in enumerate(read_values):
                 if not ret:
-                    print("Error: Failed to capture image")
+                    Event_log.log('capture_error', camera=i, frame=frame_index[i])
                     break
+                frame_index[i] += 1
                 if not recording:
                     if i == 0:
                         ring_buffer_0.append(frame)
                     elif i == 1:
                         ring_buffer_1.append(frame)
 
-                frame_copy = np.copy(frame)
-                if not recording:
-                    contour = detect_motion(frame_copy, back_sub, kernel, min_contour_area, i)
+                # Recording always has priority: no detection or preview while recording,
+                # except on camera 0 until the crossing after a predictive trigger has been seen,
+                # and only on the frame pairs the QoS watchdog lets detection run on
+                contour = None
+                if detect and (not recording or (crossing is not None and i == 0)):
+                    frame_copy = np.copy(frame)
+                    if multi_object:
+                        # All blobs are tracked, the chosen track is turned into a contour for the rest of the loop
+                        centroids, areas, boxes = detect_blobs(frame_copy, models[i], kernel, params['min_contour_area'], i, watchdog.detection_scale(), show)
+                        multi_trackers[i].update(frame_time, centroids, areas)
+                        chosen = multi_trackers[i].select()
+                        if chosen is not None:
+                            # The blob the track was matched to on this frame, not the one closest to the filtered position
+                            bx, by, bw, bh = boxes[multi_trackers[i].blob[chosen]]
+                            contour = np.array([[[bx, by]], [[bx + bw, by]], [[bx + bw, by + bh]], [[bx, by + bh]]], dtype=np.int32)
+                            # A different object than the one followed so far: start its velocity estimate fresh
+                            if trackers[i].track_id != multi_trackers[i].ids[chosen]:
+                                trackers[i].reset()
+                                trackers[i].track_id = multi_trackers[i].ids[chosen]
+                        if show:
+                            for bx, by, bw, bh in boxes:
+                                cv2.rectangle(frame_copy, (bx, by), (bx + bw, by + bh), (255, 0, 0), 1)
+                    else:
+                        contour = detect_motion(frame_copy, models[i], kernel, params['min_contour_area'], i, watchdog.detection_scale(), show)
 
                 if contour is not None:
                     x, y, w, h = cv2.boundingRect(contour)
@@ -225,44 +570,68 @@ def motion_detection():
                     text = f"x: {x2}, y: {y2}"
                     cv2.putText(frame_copy, text, (x2 - 10, y2 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
-                    if i == 0:
-                        is_motion_detected_0 = True
-                    elif i == 1:
-                        is_motion_detected_1 = True
-
-                    cv2.imshow(f"frame-{i}", frame_copy)
-                    if cv2.waitKey(1) == ord('q'):
-                        break
-
-                    # STARTING VIDEO RECORDING
-                    if is_motion_detected_0 and is_motion_detected_1 and prev_x is not None and x2 < prev_x and not recording:
-                        print("Motion Detected!")
-                        stimulus_event.set() 
-                        print("Stimulus Starting...")
-                        log_time = datetime.now().strftime("%Y-%-m-%d_%H-%M-%S.%f")[:-3]
-                        print("Start: ", log_time)
-                        start_time = time.time()
-                        # Logs start_time
-                        with open("time_log.txt", mode='a') as file:
-                            file.write(f"Start time: {log_time} \n")
-                        recording = True
-                        frame_counter = 0
-                        frame_height, frame_width = frame.shape[:2]
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_")
-                        print(frame_width, frame_height)
-
-                        is_motion_detected_0 = False
-                        is_motion_detected_1 = False
-                        
-
-                    prev_x = x2
-                else:
-                    if i == 0:
-                        is_motion_detected_0 = False
-                    elif i == 1:
-                        is_motion_detected_1 = False
+                    if not recording:
+                        trackers[i].update(frame_time, x2, y2)
+
+                    if show:
+                        cv2.imshow(f"frame-{i}", frame_copy)
+                        if cv2.waitKey(1) == ord('q'):
+                            break
+                elif not recording and detect:
+                    trackers[i].miss()
+
+                # Actual crossing of target_x in camera 0 after a predictive trigger, to check the compensation
+                if crossing is not None and i == 0:
+                    if contour is not None and x2 <= target_x[0]:
+                        Event_log.log('crossing', predicted=crossing['predicted'], actual=frame_time,
+                                      error=round(frame_time - crossing['predicted'], 4), frame_0=frame_index[0])
+                        crossing = None
+                    elif frame_time > crossing['predicted'] + crossing_timeout:
+                        Event_log.log('crossing', predicted=crossing['predicted'], actual=None, frame_0=frame_index[0])
+                        crossing = None
+
+                # STARTING VIDEO RECORDING
+                # Once both cameras of the pair are processed: both trackers have to see consistent leftward motion
+                if i == len(read_values) - 1 and not recording and Motion_tracker.stereo_trigger(trackers) and Control_server.armed.is_set():
+                    # Hardware timestamp of the decision first, everything else comes after it
+                    if md_pulse is not None:
+                        pulse_start, pulse_end = md_pulse.emit()
+                        Event_log.log('md_pulse', frame_0=frame_index[0], frame_1=frame_index[1], frame_time_ns=int(frame_time * 1e9),
+                                      emit_ns=pulse_start, emitted_ns=pulse_end, write_ns=pulse_end - pulse_start)
+                    stimulus_params.update(params)
+                    onset_at, predicted = schedule_stimulus(trackers, frame_time)
+                    stimulus_params['onset_at'] = onset_at
+                    if predicted is not None:
+                        crossing = {'predicted': predicted}
+                    # Keep the converged backgrounds (only a copy here, the stimulus and the relays go first)
+                    for model in models:
+                        model.snapshot()
+                    stimulus_event.set() 
+                    if stim_process is not None:
+                        stim_process.trigger(stimulus_params)
+                    if relay_mode == 'trigger':
+                        Relay_code.trigger(frame_time)
+                    # The shadow models are seeded from the snapshots in helper threads and keep learning while recording
+                    for model in models:
+                        model.start_shadow()
+                    start_time = time.time()
+                    # Only an enqueue, the event log formats and writes it in its own thread
+                    Event_log.log('trigger', frame_0=frame_index[0], frame_1=frame_index[1],
+                                  tracks=[tracker.state() for tracker in trackers], frame_size=frame.shape[:2],
+                                  frame_time=frame_time, onset_at=onset_at, predicted_crossing=predicted,
+                                  stimulus={'duration': duration, 'speed': stimulus_params['speed'], 'direction': stimulus_params['direction'],
+                                            'color': color_selected, 'background_white': stimulus_params['background_white'], 'wait_time': wait_time})
+                    recording = True
+                    trials += 1
+                    trial_qos = watchdog.pop_transitions()
+                    frame_counter = 0
+                    for tracker in trackers:
+                        tracker.reset()
+                    for tracker in multi_trackers:
+                        tracker.reset()
 
                 if recording:
+                    models[i].shadow_update(frame)
                     if i == 0:
                         additional_frames_0.append(frame)
                     elif i == 1:
@@ -271,9 +640,11 @@ def motion_detection():
                     if frame_counter - .5 >= additional_frame_size:
                         recording = False
                         stimulus_event.clear()
-                        print("End: ", datetime.now().strftime("%Y%-m-%d_%H:%M:%S.%f")[:-3])
-                        print("Finished recording. Retrieving buffer and saving images...")
-                        print("Elapsed time:", time.time() - start_time)
+                        Event_log.log('recording_end', frame_0=frame_index[0], frame_1=frame_index[1], elapsed=time.time() - start_time)
+                        log_time = datetime.fromtimestamp(start_time).strftime("%Y-%-m-%d_%H-%M-%S.%f")[:-3]
+
+                        # Saving runs on the writer cores without real-time priority
+                        Sched_profile.apply_role('writer')
 
                         # SPECIFY SAVED FOLDER LOCATION HERE
                         base_folder = '/media/some_postdoc/78082F15665E4EB7/DATA'
@@ -300,28 +671,54 @@ def motion_detection():
                             cv2.imwrite(os.path.join(folder_name_0, f'frame_{idx}_0.bmp'), frame)
                         for idx, frame in enumerate(combined_frames_1):
                             cv2.imwrite(os.path.join(folder_name_1, f'frame_{idx}_1.bmp'), frame)
-                        print("Images Saved!")
+                        Event_log.log('saved', folder_0=folder_name_0, folder_1=folder_name_1,
+                                      frames_0=len(combined_frames_0), frames_1=len(combined_frames_1))
+                        write_trial_metadata(folder_name_0, {
+                            'start': log_time,
+                            'frames_0': len(combined_frames_0),
+                            'frames_1': len(combined_frames_1),
+                            'qos': watchdog.summary(),
+                            'qos_transitions': trial_qos + watchdog.pop_transitions(),
+                            # Relay switches since the previous trial (planned / actual time.monotonic())
+                            'relay_switches': Relay_code.pop_switches(),
+                            # Relay settings of the trial (the parameters at the trigger)
+                            'relay': {'mode': relay_mode, 'pause': stimulus_params['relay_pause'],
+                                      'duration': stimulus_params['relay_duration'],
+                                      'trigger_delay': stimulus_params['relay_trigger_delay']},
+                        })
                         additional_frames_0.clear()
                         additional_frames_1.clear()
                         ring_buffer_0.clear()
                         ring_buffer_1.clear()
                         del combined_frames_0
                         del combined_frames_1
-                        back_sub = cv2.createBackgroundSubtractorMOG2(history=180, varThreshold=60, detectShadows=False)
-                        
-                        time.sleep(5)
-                        print("Resuming motion detection...")
+                        for model in models:
+                            model.save()
+                            model.rearm()
+
+                        # Re-arm as soon as the warm models have caught up with the arena
+                        Sched_profile.apply_role('capture')
+                        rearm_time = wait_for_background(models)
+                        watchdog.resume()
+                        Event_log.log('resumed', frame_0=frame_index[0], frame_1=frame_index[1], rearm_time=round(rearm_time, 3))
+            watchdog.end(recording)
     except KeyboardInterrupt:
         print("Stopping motion detection.")
-        Relay_code.request_stop()
-        relay_thread.join()
     finally:
+        # Also when startup or the loop failed, otherwise the relay thread waits for triggers forever
+        Relay_code.request_stop()
         running_flag.clear()  
-        stim_thread.join()
+        for thread in threads:
+            thread.join()
+        if IR_LED.queue is not None:
+            IR_LED.queue.stop()
         sleep(1)
-        cap.release()
+        if cap is not None:
+            cap.release()
         cv2.destroyAllWindows()
         print("Closing camera and resetting...")
+        Control_server.stop()
+        Event_log.stop()
 
                     
 
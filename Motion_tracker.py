@@ -0,0 +1,264 @@
+import numpy as np # 1.26.4
+try:
+    # Optional: optimal (Hungarian) assignment in MultiTracker, greedy matching is used without it
+    from scipy.optimize import linear_sum_assignment # 1.11
+except ImportError:
+    linear_sum_assignment = None
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# numpy: 1.26.4
+
+# Per-camera motion tracker with an alpha-beta filter.
+# Each camera gets its own Tracker, fed with the centroid of the detected motion and the time of the frame.
+# The filter smooths the position and estimates the velocity (px/s), so the trigger no longer rests on one
+# noisy pair of centroids from two different cameras.
+# stereo_trigger() fires when both cameras have seen consistent leftward motion.
+#
+# MultiTracker keeps every blob above min_contour_area instead of only the largest one and associates them
+# from frame to frame (vectorized distance matrix + greedy or Hungarian matching), so two insects, or a shadow
+# and an insect, don't make the trigger jump between objects. select() picks the track the trigger follows.
+
+# CHANGE the filter gains here (0-1, higher = follows the measurements faster, less smoothing)
+alpha = 0.5
+beta = 0.2
+
+# Leftward velocity (px/s) that counts as motion to the left, and for how many updates in a row it's needed
+min_speed = 100
+consistent_updates = 3
+
+# Frames without a detection before the track is dropped
+max_missed = 5
+
+# Number of (t, x, y, vx, vy) entries kept in the history ring of each tracker
+history_size = 64
+
+
+class Tracker:
+
+    __slots__ = ('camera', 'track_id', 'x', 'y', 'vx', 'vy', 't', 'updates', 'leftward', 'missed', '_history', '_head')
+
+    def __init__(self, camera):
+        self.camera = camera
+        self._history = np.zeros((history_size, 5))
+        self.reset()
+
+    def reset(self):
+        self.track_id = None
+        self.x = None
+        self.y = None
+        self.vx = 0.0
+        self.vy = 0.0
+        self.t = None
+        self.updates = 0
+        self.leftward = 0
+        self.missed = 0
+        self._head = 0
+
+    # New measurement (centroid x, y in pixels) at time t (seconds)
+    def update(self, t, x, y):
+        self.missed = 0
+        if self.x is None:
+            self.x, self.y, self.t = float(x), float(y), t
+        else:
+            dt = t - self.t
+            if dt <= 0:
+                return
+            if self.updates == 1:
+                # Second measurement: start from the measured velocity
+                self.vx = (x - self.x) / dt
+                self.vy = (y - self.y) / dt
+                self.x, self.y = float(x), float(y)
+            else:
+                # Predict, then correct with the residual
+                x_pred = self.x + self.vx * dt
+                y_pred = self.y + self.vy * dt
+                rx = x - x_pred
+                ry = y - y_pred
+                self.x = x_pred + alpha * rx
+                self.y = y_pred + alpha * ry
+                self.vx += beta * rx / dt
+                self.vy += beta * ry / dt
+            self.t = t
+        self.updates += 1
+
+        if self.updates > 1 and self.vx < -min_speed:
+            self.leftward += 1
+        else:
+            self.leftward = 0
+
+        self._history[self._head % history_size] = (t, self.x, self.y, self.vx, self.vy)
+        self._head += 1
+
+    # No detection on this frame
+    def miss(self):
+        self.missed += 1
+        if self.missed > max_missed:
+            self.reset()
+
+    # Position predicted for time t
+    def predict(self, t):
+        if self.x is None:
+            return None
+        dt = t - self.t
+        return self.x + self.vx * dt, self.y + self.vy * dt
+
+    # Time at which the track reaches target_x at its current velocity (None if it's moving away from it)
+    def crossing_time(self, target_x):
+        if self.x is None or self.vx == 0:
+            return None
+        dt = (target_x - self.x) / self.vx
+        if dt < 0:
+            return None
+        return self.t + dt
+
+    def moving_left(self):
+        return self.leftward >= consistent_updates
+
+    # History (t, x, y, vx, vy) in time order, oldest first
+    def history(self):
+        count = min(self._head, history_size)
+        if self._head <= history_size:
+            return self._history[:count].copy()
+        start = self._head % history_size
+        return np.concatenate((self._history[start:], self._history[:start]))
+
+    def state(self):
+        return {'x': self.x, 'y': self.y, 'vx': self.vx, 'vy': self.vy, 'updates': self.updates}
+
+
+# Both cameras agree on consistent leftward motion
+def stereo_trigger(trackers):
+    return all(tracker.moving_left() for tracker in trackers)
+
+
+# MULTI-OBJECT TRACKING
+# Largest distance (px) between a predicted track position and a blob to still match them
+max_distance = 150
+# Matching: 'greedy' or 'hungarian' (needs scipy, falls back to greedy)
+matching = 'greedy'
+# Which track the trigger follows: 'oldest_left' (oldest track moving left, else the largest),
+# 'largest' (largest blob) or 'fastest_left' (fastest leftward track)
+selection = 'oldest_left'
+
+
+class MultiTracker:
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.next_id = 0
+        # One row per track
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.t = np.zeros(0)
+        self.area = np.zeros(0)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.missed = np.zeros(0, dtype=np.int64)
+        # Index of the blob of the last update() each track was matched to (or started from), -1 = none
+        self.blob = np.zeros(0, dtype=np.int64)
+
+    def reset(self):
+        self.__init__(self.camera)
+
+    # New frame at time t with the blob centroids (N x 2) and areas (N)
+    def update(self, t, centroids, areas):
+        centroids = np.asarray(centroids, dtype=float).reshape(-1, 2)
+        areas = np.asarray(areas, dtype=float).reshape(-1)
+        tracks = len(self.ids)
+        matched_tracks = np.zeros(0, dtype=np.int64)
+        matched_blobs = np.zeros(0, dtype=np.int64)
+
+        if tracks and len(centroids):
+            dt = (t - self.t)[:, None]
+            predicted = self.pos + self.vel * dt
+            # Distance of every track to every blob
+            distance = np.linalg.norm(predicted[:, None, :] - centroids[None, :, :], axis=2)
+            matched_tracks, matched_blobs = match(distance)
+
+            # Alpha-beta update of the matched tracks
+            dt = np.maximum(t - self.t[matched_tracks], 1e-6)[:, None]
+            residual = centroids[matched_blobs] - predicted[matched_tracks]
+            first = self.age[matched_tracks] == 1
+            new_vel = self.vel[matched_tracks] + beta * residual / dt
+            new_vel[first] = ((centroids[matched_blobs] - self.pos[matched_tracks]) / dt)[first]
+            new_pos = predicted[matched_tracks] + alpha * residual
+            new_pos[first] = centroids[matched_blobs][first]
+            self.pos[matched_tracks] = new_pos
+            self.vel[matched_tracks] = new_vel
+            self.t[matched_tracks] = t
+            self.area[matched_tracks] = areas[matched_blobs]
+            self.age[matched_tracks] += 1
+            self.missed[matched_tracks] = 0
+
+        # Tracks without a blob
+        unmatched = np.ones(tracks, dtype=bool)
+        unmatched[matched_tracks] = False
+        self.missed[unmatched] += 1
+        self.blob = np.full(tracks, -1, dtype=np.int64)
+        self.blob[matched_tracks] = matched_blobs
+
+        # Drop lost tracks
+        keep = self.missed <= max_missed
+        if not keep.all():
+            self.ids, self.pos, self.vel = self.ids[keep], self.pos[keep], self.vel[keep]
+            self.t, self.area, self.age, self.missed = self.t[keep], self.area[keep], self.age[keep], self.missed[keep]
+            self.blob = self.blob[keep]
+
+        # New tracks for blobs without a track
+        new = np.ones(len(centroids), dtype=bool)
+        new[matched_blobs] = False
+        count = int(new.sum())
+        if count:
+            self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + count)))
+            self.next_id += count
+            self.pos = np.concatenate((self.pos, centroids[new]))
+            self.vel = np.concatenate((self.vel, np.zeros((count, 2))))
+            self.t = np.concatenate((self.t, np.full(count, t)))
+            self.area = np.concatenate((self.area, areas[new]))
+            self.age = np.concatenate((self.age, np.ones(count, dtype=np.int64)))
+            self.missed = np.concatenate((self.missed, np.zeros(count, dtype=np.int64)))
+            self.blob = np.concatenate((self.blob, np.flatnonzero(new)))
+
+    # Index of the track the trigger follows (only tracks seen on this frame), None if there is none.
+    # blob[index] is the blob of this frame that belongs to it
+    def select(self):
+        seen = np.flatnonzero(self.missed == 0)
+        if len(seen) == 0:
+            return None
+        left = seen[(self.age[seen] > 1) & (self.vel[seen, 0] < -min_speed)]
+        if selection == 'fastest_left' and len(left):
+            return int(left[np.argmin(self.vel[left, 0])])
+        if selection == 'oldest_left' and len(left):
+            return int(left[np.argmax(self.age[left])])
+        return int(seen[np.argmax(self.area[seen])])
+
+    def state(self, index):
+        return {'id': int(self.ids[index]), 'x': float(self.pos[index, 0]), 'y': float(self.pos[index, 1]),
+                'vx': float(self.vel[index, 0]), 'vy': float(self.vel[index, 1]), 'age': int(self.age[index])}
+
+
+# Matches the rows (tracks) and columns (blobs) of a distance matrix, pairs further than max_distance are not matched.
+# Returns the matched row and column indices.
+def match(distance):
+    if matching == 'hungarian' and linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(np.minimum(distance, max_distance * 10))
+    else:
+        # Greedy: repeatedly take the closest remaining pair
+        distance = distance.copy()
+        rows = []
+        cols = []
+        for _ in range(min(distance.shape)):
+            index = np.argmin(distance)
+            row, col = divmod(int(index), distance.shape[1])
+            if distance[row, col] > max_distance:
+                break
+            rows.append(row)
+            cols.append(col)
+            distance[row, :] = np.inf
+            distance[:, col] = np.inf
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        return rows, cols
+    close = distance[rows, cols] <= max_distance
+    return rows[close].astype(np.int64), cols[close].astype(np.int64)
@@ -0,0 +1,131 @@
+import time # python version
+import Event_log
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# Time: Python version
+
+# Quality-of-service watchdog for the capture loop.
+# It compares how long the loop spends working on each frame pair against the camera frame period
+# (1 / cap.get(cv2.CAP_PROP_FPS)). When the loop falls behind it steps down non-essential work,
+# one level at a time, and restores it again when there is headroom:
+#   Level 0: everything at full rate
+#   Level 1: preview window only refreshed every preview_every frames
+#   Level 2: + the cleanup and contours of the motion detection on a downscaled mask (detect_scale),
+#            the background model itself always sees full resolution frames
+#   Level 3: + motion detection only every detect_every frame pairs
+# Recording is never degraded: the ring buffer and the recorded frames are always appended.
+
+# CHANGE the degradation steps here
+preview_every = 8
+detect_scale = 0.5
+detect_every = 2
+
+# Load above high_load (fraction of the frame period spent working) steps down one level,
+# load below low_load steps back up one level
+high_load = 0.9
+low_load = 0.6
+
+# How many frame pairs the load has to stay above / below the limit before changing level
+degrade_after = 30
+restore_after = 450
+
+max_level = 3
+
+
+class Watchdog:
+
+    def __init__(self, camera_fps):
+        self.frame_period = 1.0 / camera_fps if camera_fps > 0 else 0.0
+        self.level = 0
+        self.load = 0.0
+        self.loop_fps = camera_fps
+        self.transitions = []
+        self._frame = 0
+        self._over = 0
+        self._under = 0
+        self._work_start = None
+        self._last_end = None
+
+    # Call right after cap.read() returns, before any processing of the frame pair
+    def begin(self):
+        self._work_start = time.perf_counter()
+
+    # Call at the end of the loop iteration, after all processing of the frame pair
+    def end(self, recording):
+        now = time.perf_counter()
+        self._frame += 1
+        work = now - self._work_start
+        if self._last_end is not None:
+            period = now - self._last_end
+            if period > 0:
+                self.loop_fps += 0.05 * (1.0 / period - self.loop_fps)
+        self._last_end = now
+
+        if self.frame_period == 0:
+            return
+        self.load += 0.05 * (work / self.frame_period - self.load)
+
+        if self.load > high_load:
+            self._over += 1
+            self._under = 0
+        elif self.load < low_load:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = 0
+            self._under = 0
+
+        if self._over >= degrade_after and self.level < max_level:
+            self._change(self.level + 1, recording)
+        elif self._under >= restore_after and self.level > 0:
+            self._change(self.level - 1, recording)
+
+    # Call after a pause of the loop (saving a trial) so the pause isn't counted as load
+    def resume(self):
+        self._work_start = time.perf_counter()
+        self._last_end = None
+
+    def _change(self, level, recording):
+        self.transitions.append({
+            'time': time.time(),
+            'frame': self._frame,
+            'from': self.level,
+            'to': level,
+            'load': round(self.load, 3),
+            'loop_fps': round(self.loop_fps, 1),
+            'recording': recording,
+        })
+        Event_log.log('qos', **self.transitions[-1])
+        self.level = level
+        self._over = 0
+        self._under = 0
+
+    # Should the preview window be refreshed on this frame pair
+    def show_preview(self, recording):
+        if recording:
+            return False
+        if self.level >= 1:
+            return self._frame % preview_every == 0
+        return True
+
+    # Scale factor of the foreground mask the motion detection cleans up and finds contours in
+    def detection_scale(self):
+        if self.level >= 2:
+            return detect_scale
+        return 1.0
+
+    # Should motion detection run on this frame pair
+    def run_detection(self):
+        if self.level >= 3:
+            return self._frame % detect_every == 0
+        return True
+
+    # Returns the transitions since the last call, for the trial metadata
+    def pop_transitions(self):
+        transitions = self.transitions
+        self.transitions = []
+        return transitions
+
+    def summary(self):
+        return {'level': self.level, 'load': round(self.load, 3), 'loop_fps': round(self.loop_fps, 1)}
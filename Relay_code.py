@@ -1,18 +1,34 @@
-import usbrelay_py
+try:
+    import usbrelay_py
+except ImportError:
+    # Only needed with backend = 'usbrelay'
+    usbrelay_py = None
 import time 
 import threading
+import queue
+import Relay_hidraw
 
 # OS Version: Ubuntu 22.04.4
 # Python: 3.10.12
 # Time: Python version
 # Threading: Python version
+# Queue: Python version
 
 # Note that a call to count() is required to enumerate the attached relays
 # before attempting to operate the relays
 
+# CHANGE the relay backend here: 'usbrelay' (usbrelay_py) or 'hidraw' (Relay_hidraw.py: /dev/hidraw* directly,
+# keeps the relay state cached and skips switches that change nothing)
+backend = 'usbrelay'
+# Relay_hidraw.RelayBoard opened by init() with backend = 'hidraw'
+hid_board = None
+
 # This function checks if relay is connected or not 
 def board_check():
-    count = usbrelay_py.board_count()
+    if backend == 'hidraw':
+        count = len(Relay_hidraw.find_devices())
+    else:
+        count = usbrelay_py.board_count()
     print("Count: ",count)
 
 # This function gives the detials to the board
@@ -23,63 +39,154 @@ def board_details():
 
 # Initializes the board to find the relay
 def init ():
-    global boards, board
+    global boards, board, hid_board
+    if backend == 'hidraw':
+        hid_board = Relay_hidraw.RelayBoard()
+        return
     boards = board_details()
     board = boards[0]
     
 # Turn on relay based on the number 
 def on_relay(number):
+    if hid_board is not None:
+        hid_board.on(number)
+        return
     usbrelay_py.board_control(board[0],number,1)
 
 # Turn off the relay based on the number 
 def off_relay(number):
+    if hid_board is not None:
+        hid_board.off(number)
+        return
     usbrelay_py.board_control(board[0],number,0)
 
 
 # Global stop event
 stop_event = threading.Event()
 
+# Set once the relay board is opened
+ready = threading.Event()
+
+# Current pause, duration and trigger delay, can be changed while the relays are running with set_timing()
+timing = {}
+
+# Changes the pause, duration and trigger delay (None keeps it), used from the next relay cycle / trigger on
+def set_timing(pause, duration, delay=None):
+    timing['pause'] = pause
+    timing['duration'] = duration
+    if delay is not None:
+        timing['trigger_delay'] = delay
+
+# CHANGE the time between turning off relay 1 and turning on relay 2 here (seconds)
+gap = 5
+
+# Every switch of the relays with the planned and actual time (time.monotonic()), see pop_switches()
+switches = []
+switches_lock = threading.Lock()
+# Called with the record of every switch (from the relay thread, keep it short)
+on_switch = None
+
+# TRIGGER MODE: Start(..., mode='trigger') switches the relays relative to the motion trigger instead of on a timer,
+# pause isn't used then
+# CHANGE how long after the trigger relay 1 turns on here (seconds, default of Start(..., trigger_delay=None))
+trigger_delay = 0.5
+# Trigger times (time.monotonic()) waiting for the relay thread, None stops it
+triggers = queue.SimpleQueue()
+
+# Timeline after a trigger, same format and relays as cycle_timeline() with delay instead of pause
+def trigger_timeline(delay, duration):
+    return [
+        (delay, 1, 1),
+        (delay + duration, 1, 0),
+        (delay + duration + gap, 2, 1),
+        (delay + 2 * duration + gap, 2, 0),
+    ]
+
+# Schedules the trigger timeline from the time of the trigger (time.monotonic()), returns right away
+def trigger(t):
+    triggers.put(t)
+
+# Timeline of one relay cycle: (time from the start of the cycle in seconds, relay number, 1 = on / 0 = off)
+# The next cycle starts right after the last entry.
+def cycle_timeline(pause, duration):
+    return [
+        (pause, 1, 1),
+        (pause + duration, 1, 0),
+        (pause + duration + gap, 2, 1),
+        (pause + 2 * duration + gap, 2, 0),
+    ]
+
+# Switches a relay and records when it happened
+def switch(number, state, planned=None, trigger=None):
+    if state:
+        on_relay(number)
+    else:
+        off_relay(number)
+    actual = time.monotonic()
+    record = {'relay': number, 'state': state, 'planned': planned, 'actual': actual, 'trigger': trigger}
+    with switches_lock:
+        switches.append(record)
+    if on_switch is not None:
+        on_switch(record)
+    print(f"TURN {'ON' if state else 'OFF'} {number}")
+    return actual
+
+# Runs a timeline from start (time.monotonic()). The deadlines are start + the times of the timeline, so
+# the time a switch takes doesn't add up from one switch to the next. The waits are stop_event.wait(),
+# a stop request ends the timeline right away. Returns False if it was stopped.
+# trigger: time of the trigger the timeline belongs to, kept with the switches
+def run_timeline(timeline, start, trigger=None):
+    for offset, number, state in sorted(timeline):
+        planned = start + offset
+        if stop_event.wait(max(0, planned - time.monotonic())):
+            return False
+        switch(number, state, planned, trigger)
+    return True
+
+# Returns and forgets the recorded switches
+def pop_switches():
+    with switches_lock:
+        recorded = switches[:]
+        switches.clear()
+    return recorded
+
 # This function starts the relay based on the pause, duration, start
 # Pause: how the system will wait until after turning on and off both relays
 # Duration: how the relay will be on for 
 # Start: indicates if it should start or not  
-def Start(pause, duration, start):
-    # Ensure the stop_event is cleared at the start
-    stop_event.clear()
+# Mode: 'free' cycles on its own timer, 'trigger' waits for trigger() and runs trigger_timeline(delay, duration) from
+# each trigger
+# clear: start from a cleared stop request. A caller that may request the stop before this thread runs calls
+# reset() itself before starting the thread and passes clear=False, so that stop request isn't lost
+# delay: time from the trigger to relay 1 in trigger mode (None: trigger_delay)
+def Start(pause, duration, start, mode='free', clear=True, delay=None):
+    if clear:
+        reset()
+    set_timing(pause, duration, trigger_delay if delay is None else delay)
 
     board_check()
     print("Found device")
     init()
     print("Opened device")
+    ready.set()
 
     try:
-        while start and not stop_event.is_set():
-
-            # Wait for a certain time
-            time.sleep(pause)
-
-            # Turn on the first relay & wait duration
-            on_relay(1)
-            print("TURN ON 1")
-            time.sleep(duration)
-
-            # Turn off the first relay & wait before turning second on
-            off_relay(1)
-            print("TURN OFF 1")
-            time.sleep(5)
-
-            # Turn on the second relay & wait duration
-            on_relay(2)
-            print("TURN ON 2")
-            time.sleep(duration)
+        while start and mode == 'trigger' and not stop_event.is_set():
+            # Wakes up as soon as trigger() or request_stop() put something on the queue
+            t = triggers.get()
+            if t is None:
+                break
+            if not run_timeline(trigger_timeline(timing['trigger_delay'], timing['duration']), t, trigger=t):
+                break
 
-            # Turn off the second relay
-            off_relay(2)
-            print("TURN OFF 2")
+        cycle_start = time.monotonic()
+        while start and mode == 'free' and not stop_event.is_set():
+            timeline = cycle_timeline(timing['pause'], timing['duration'])
 
             # Stops when the main program closes
-            if stop_event.is_set():
+            if not run_timeline(timeline, cycle_start):
                 break
+            cycle_start += timeline[-1][0]
     finally:
         Stop()  # Ensure relays are turned off in any case
         print("Relays turned off")
@@ -90,7 +197,14 @@ def Stop():
     off_relay(2)
     print("Relays turned off")
 
+# Clears the stop request and the triggers that weren't handled
+def reset():
+    stop_event.clear()
+    while not triggers.empty():
+        triggers.get()
+
 # Requests the relays to be turned off 
 def request_stop():
     stop_event.set()
+    triggers.put(None)
 
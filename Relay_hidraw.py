@@ -0,0 +1,179 @@
+import fcntl # python version
+import glob # python version
+import os # python version
+import threading # python version
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# fcntl, glob, os, threading: Python version
+
+# Linux backend for the USB HID relay board of Relay_test.py (16c0:05df), through /dev/hidraw* instead of pywinusb.
+# Same feature report protocol: [0, command, relay, 0, 0, 0, 0, 0, 1]
+#   0xFF = relay on, 0xFD = relay off, 0xFE = all on, 0xFC = all off
+# and the status read back has the relay bits (relay 1 = bit 0) in byte 8.
+#
+# RelayBoard keeps the state of the relays in a mask, so switching costs one write and no status read
+# (Relay_test.py reads the status after every switch, two USB round trips per switch). The mask is read
+# from the board once when it is opened, verify=True reads it back after every write like before.
+# The board has no "set all relays to this mask" command, set_mask() sends all on / all off when it can and
+# otherwise one command per relay that changes.
+# FakeHidraw behaves like the board, so the code can be tried without it:
+#   board = Relay_hidraw.RelayBoard(Relay_hidraw.FakeHidraw())
+
+USB_CFG_VENDOR_ID = 0x16c0
+USB_CFG_DEVICE_ID = 0x05DF
+
+ON = 0xFF
+OFF = 0xFD
+ALL_ON = 0xFE
+ALL_OFF = 0xFC
+
+# Report ID + 8 bytes
+report_size = 9
+# Byte of the status report with the relay bits
+status_byte = 8
+
+
+# ioctl numbers of linux/hidraw.h: HIDIOCSFEATURE(len) = _IOC(_IOC_WRITE|_IOC_READ, 'H', 0x06, len), HIDIOCGFEATURE 0x07
+def _ioc(number, size):
+    return (3 << 30) | (size << 16) | (ord('H') << 8) | number
+
+HIDIOCSFEATURE = _ioc(0x06, report_size)
+HIDIOCGFEATURE = _ioc(0x07, report_size)
+
+
+# /dev/hidraw* paths of the relay boards that are plugged in
+def find_devices(vendor_id=USB_CFG_VENDOR_ID, product_id=USB_CFG_DEVICE_ID):
+    wanted = f"{vendor_id:08X}:{product_id:08X}"
+    devices = []
+    for uevent in sorted(glob.glob('/sys/class/hidraw/hidraw*/device/uevent')):
+        with open(uevent) as file:
+            for line in file:
+                if line.startswith('HID_ID=') and line.strip().upper().endswith(wanted):
+                    devices.append('/dev/' + uevent.split('/')[4])
+    return devices
+
+
+# One hidraw device, feature reports through ioctl
+class Hidraw:
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR)
+
+    def set_feature(self, report):
+        fcntl.ioctl(self.fd, HIDIOCSFEATURE, bytes(report))
+
+    def get_feature(self):
+        report = bytearray(report_size)
+        fcntl.ioctl(self.fd, HIDIOCGFEATURE, report)
+        return report
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+# Stands in for the hidraw device of the board, counts the reports like USB round trips
+class FakeHidraw:
+
+    def __init__(self, relays=2):
+        self.path = 'fake'
+        self.relays = relays
+        self.mask = 0
+        self.writes = 0
+        self.reads = 0
+
+    def set_feature(self, report):
+        self.writes += 1
+        command, relay = report[1], report[2]
+        if command == ON and 1 <= relay <= self.relays:
+            self.mask |= 1 << (relay - 1)
+        elif command == OFF and 1 <= relay <= self.relays:
+            self.mask &= ~(1 << (relay - 1))
+        elif command == ALL_ON:
+            self.mask = (1 << self.relays) - 1
+        elif command == ALL_OFF:
+            self.mask = 0
+
+    def get_feature(self):
+        self.reads += 1
+        report = bytearray(report_size)
+        report[status_byte] = self.mask
+        return report
+
+    def close(self):
+        pass
+
+
+class RelayBoard:
+
+    # device: Hidraw, FakeHidraw, a /dev/hidraw* path or None for the first board found
+    def __init__(self, device=None, relays=2, verify=False):
+        if device is None:
+            devices = find_devices()
+            if not devices:
+                raise OSError("No USB relay board found (/dev/hidraw*, 16c0:05df)")
+            device = devices[0]
+        if isinstance(device, str):
+            device = Hidraw(device)
+        self.device = device
+        self.relays = relays
+        self.verify = verify
+        self.writes = 0
+        self._lock = threading.Lock()
+        self.mask = self.read_mask()
+
+    # Reads the relay state from the board and updates the cached mask
+    def read_mask(self):
+        self.mask = self.device.get_feature()[status_byte] & ((1 << self.relays) - 1)
+        return self.mask
+
+    def _send(self, command, relay=0):
+        self.device.set_feature([0, command, relay, 0, 0, 0, 0, 0, 1])
+        self.writes += 1
+
+    # Switches the relays to mask (relay 1 = bit 0), returns the number of reports sent
+    def set_mask(self, mask):
+        with self._lock:
+            mask &= (1 << self.relays) - 1
+            changed = mask ^ self.mask
+            if not changed:
+                return 0
+            if mask == (1 << self.relays) - 1 and bin(changed).count('1') > 1:
+                self._send(ALL_ON)
+                sent = 1
+            elif mask == 0 and bin(changed).count('1') > 1:
+                self._send(ALL_OFF)
+                sent = 1
+            else:
+                sent = 0
+                for relay in range(1, self.relays + 1):
+                    bit = 1 << (relay - 1)
+                    if changed & bit:
+                        self._send(ON if mask & bit else OFF, relay)
+                        sent += 1
+            self.mask = mask
+            if self.verify and self.read_mask() != mask:
+                raise OSError(f"Relay board reports {self.mask:#04b} instead of {mask:#04b}")
+            return sent
+
+    def on(self, relay):
+        return self.set_mask(self.mask | 1 << (relay - 1))
+
+    def off(self, relay):
+        return self.set_mask(self.mask & ~(1 << (relay - 1)))
+
+    def all_on(self):
+        return self.set_mask((1 << self.relays) - 1)
+
+    def all_off(self):
+        return self.set_mask(0)
+
+    # From the cached mask, no USB transfer
+    def is_on(self, relay):
+        return bool(self.mask & 1 << (relay - 1))
+
+    def close(self):
+        self.device.close()
@@ -0,0 +1,160 @@
+import os # python version
+import ctypes # python version
+import errno # python version
+import resource # python version
+import threading # python version
+import numpy as np # 1.26.4
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# os, ctypes, errno, resource, threading: Python version
+# numpy: 1.26.4
+
+# CPU affinity and real-time scheduling profile for the rig.
+# Every thread calls apply_role() with its role when it starts. The role is pinned to its cores with
+# os.sched_setaffinity and, if asked for, raised to SCHED_FIFO. Anything that needs privileges
+# (SCHED_FIFO, mlockall) falls back to the normal behaviour when they are missing, and report()
+# prints what was actually applied.
+# NOTE: on Linux sched_setaffinity / sched_setscheduler with pid 0 only change the calling thread.
+
+# CHANGE the cores of each role here (our host has 8 cores: 0-7)
+# capture:  camera read + motion detection loop (main thread)
+# stimulus: pygame thread in init_vis_stim()
+# relay:    Relay_code.Start thread
+# opencv:   OpenCV's worker pool (used by the capture thread)
+# writer:   saving the frames of a trial to disk
+# gpio:     IR_LED command queue worker, switches the LEDs at the flip time of their frame
+# helper:   everything else (startup pool, control server, event log, stimulus process reader), off the
+#           capture and stimulus cores and without SCHED_FIFO. Threads inherit the affinity and policy of the
+#           thread that starts them, so every helper thread applies its role itself
+# fifo: raise the thread to SCHED_FIFO with the given priority (1-99), needs CAP_SYS_NICE or root
+profile = {
+    'capture':  {'cores': [2], 'fifo': True, 'priority': 50},
+    'stimulus': {'cores': [3], 'fifo': True, 'priority': 40},
+    'relay':    {'cores': [1], 'fifo': False},
+    'opencv':   {'cores': [4, 5, 6, 7]},
+    'writer':   {'cores': [0, 1, 4, 5, 6, 7], 'fifo': False},
+    'gpio':     {'cores': [1], 'fifo': True, 'priority': 45},
+    'helper':   {'cores': [0, 1], 'fifo': False},
+}
+
+# Lock the memory of the process (ring buffers included) so it can't be paged out
+lock_memory = True
+
+# mlockall flags (sys/mman.h)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+MCL_ONFAULT = 4
+
+# What was actually applied, per role
+applied = {}
+_lock = threading.Lock()
+
+
+# Pins the calling thread to the cores of the role and sets its scheduling policy
+def apply_role(role):
+    settings = profile.get(role)
+    result = {'thread': threading.current_thread().name, 'tid': threading.get_native_id()}
+    if settings is None:
+        result['error'] = 'no profile'
+        _record(role, result)
+        return result
+
+    available = os.sched_getaffinity(0)
+    cores = [core for core in settings.get('cores', []) if core in available]
+    if cores:
+        try:
+            os.sched_setaffinity(0, cores)
+            result['cores'] = sorted(os.sched_getaffinity(0))
+        except OSError as error:
+            result['cores'] = f"unchanged ({error.strerror})"
+    else:
+        result['cores'] = f"unchanged (cores {settings.get('cores')} not available)"
+
+    if settings.get('fifo'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(settings.get('priority', 50)))
+            result['policy'] = f"SCHED_FIFO {settings.get('priority', 50)}"
+        except (OSError, AttributeError) as error:
+            result['policy'] = f"SCHED_OTHER (SCHED_FIFO denied: {getattr(error, 'strerror', error)})"
+    else:
+        # Make sure a thread changing role (capture -> writer) drops SCHED_FIFO
+        try:
+            if os.sched_getscheduler(0) != os.SCHED_OTHER:
+                os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        except (OSError, AttributeError):
+            pass
+        result['policy'] = 'SCHED_OTHER'
+
+    _record(role, result)
+    return result
+
+
+# Runs OpenCV's worker pool on the opencv cores.
+# The pool threads are created by the first parallel OpenCV call and inherit the affinity of the
+# thread that creates them, so this has to be called from the capture thread before apply_role('capture').
+def apply_opencv(cv2):
+    settings = profile.get('opencv', {})
+    available = os.sched_getaffinity(0)
+    cores = [core for core in settings.get('cores', []) if core in available]
+    result = {}
+    if not cores:
+        result['cores'] = 'unchanged (no cores available)'
+        _record('opencv', result)
+        return result
+
+    previous = os.sched_getaffinity(0)
+    try:
+        os.sched_setaffinity(0, cores)
+        cv2.setNumThreads(len(cores))
+        # Any parallel call on a full size frame starts the pool
+        cv2.GaussianBlur(np.zeros((1080, 1440), np.uint8), (5, 5), 0)
+        result['cores'] = cores
+        result['threads'] = cv2.getNumThreads()
+    except OSError as error:
+        result['cores'] = f"unchanged ({error.strerror})"
+    finally:
+        os.sched_setaffinity(0, previous)
+    _record('opencv', result)
+    return result
+
+
+# Locks the current and future memory of the process, needs CAP_IPC_LOCK or an unlimited RLIMIT_MEMLOCK
+def apply_memory_lock():
+    if not lock_memory:
+        _record('memory', {'mlockall': 'disabled'})
+        return False
+    soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    if os.geteuid() != 0 and soft != resource.RLIM_INFINITY:
+        # With a limited RLIMIT_MEMLOCK, MCL_FUTURE would make large allocations (the buffers) fail
+        _record('memory', {'mlockall': f"skipped (RLIMIT_MEMLOCK {soft} bytes, not privileged)"})
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    flags = 'MCL_CURRENT | MCL_FUTURE | MCL_ONFAULT'
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE | MCL_ONFAULT) != 0:
+        error = ctypes.get_errno()
+        # Kernels before 4.4 don't know MCL_ONFAULT
+        if error == errno.EINVAL:
+            flags = 'MCL_CURRENT | MCL_FUTURE'
+            if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+                error = ctypes.get_errno()
+            else:
+                error = None
+        if error is not None:
+            _record('memory', {'mlockall': f"failed ({os.strerror(error)})"})
+            return False
+    _record('memory', {'mlockall': flags})
+    return True
+
+
+def _record(role, result):
+    with _lock:
+        applied[role] = result
+
+
+# Prints what was actually applied
+def report():
+    with _lock:
+        for role, result in applied.items():
+            print(f"Scheduling {role}: " + ", ".join(f"{key}={value}" for key, value in result.items()))
+    return dict(applied)
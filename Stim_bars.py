@@ -0,0 +1,166 @@
+import time # python version
+import pygame # 2.6.0
+import numpy as np # 1.26.4
+import Stim_cache
+import Visual_Stimulus_One_Bar
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# time: Python version
+# pygame: 2.6.0
+# numpy: 1.26.4
+
+# Stimulus of any number of bars side by side in the middle of the screen (the animations of Video_stim.py):
+#   grow:  the bars grow from initial_height to final_height (width = height / 5, gap = width / 3)
+#   hold:  the bars stay at their final size
+#   move:  the bars move off the screen along axis, each in its direction (-1 = left / up, 0 = stays, 1 = right / down)
+# with blank seconds of background before and after. A stimulus is a spec (dict), missing keys come from defaults:
+#   Stim_bars.play({'bars': 3, 'axis': 'y', 'directions': [-1, 0, 1], 'move': 4}, colors, screen, width, height)
+# Every frame of a spec (rectangle of every bar, clipped to the screen) is computed as numpy arrays of the time
+# and kept by Stim_cache, playing it only draws the rectangles with Visual_Stimulus_One_Bar.draw_rects (the
+# background under the last bars is restored and only the changed areas of the display are updated).
+
+defaults = {
+    'bars': 2,
+    'axis': 'x',
+    # None: the first bar moves left / up, the last one right / down and the ones in between stay
+    'directions': None,
+    'initial_height': 50,
+    'final_height': 864,
+    # Seconds of every phase
+    'blank': 2,
+    'grow': 4.75,
+    'hold': 1,
+    'move': 3,
+    # The bars reach the final size after grow_scale seconds (the grow phase stops a bit before, like in Video_stim.py)
+    'grow_scale': 5,
+}
+
+# CHANGE when the way the frames are computed changes, so the cached ones are rebuilt
+version = 1
+# The old animations moved the bars by int(step * t / 10) px every loop (about 10 ms), so the bars accelerate
+# with step * t / (10 * loop_period) px/s, this is the time the move phase is computed with
+loop_period = 0.01
+
+# Compiled specs, key -> sequence
+sequences = {}
+# Frames drawn and missed (not drawn on time) by the last play()
+frame_stats = {}
+
+
+# Spec with the defaults filled in
+def full_spec(spec):
+    spec = {**defaults, **spec}
+    if spec['directions'] is None:
+        spec['directions'] = [-1] + [0] * (spec['bars'] - 2) + [1] if spec['bars'] > 1 else [1]
+    if len(spec['directions']) != spec['bars']:
+        raise ValueError(f"{spec['bars']} bars but {len(spec['directions'])} directions")
+    if spec['axis'] not in ('x', 'y'):
+        raise ValueError(f"axis has to be 'x' or 'y', not {spec['axis']!r}")
+    return spec
+
+
+# Frames of a spec at frame_rate: rects (frames, bars, 4) clipped to the screen and phase (0 grow, 1 hold, 2 move)
+def compile_bars(params):
+    period = 1 / params['frame_rate']
+    width, height = params['width'], params['height']
+    count = params['bars']
+    grow_frames = int(np.ceil(params['grow'] / period - 1e-9))
+    hold_frames = int(round(params['hold'] / period))
+    move_frames = int(np.ceil(params['move'] / period - 1e-9))
+    phase = np.repeat(np.arange(3), (grow_frames, hold_frames, move_frames))
+    frames = len(phase)
+
+    final_height = params['final_height']
+    final_width = final_height / 5
+    final_gap = final_width / 3
+    # Sizes while growing, whole pixels like the old animations, then the final sizes
+    fraction = np.arange(grow_frames) * period / params['grow_scale']
+    initial_height = params['initial_height']
+    initial_width = initial_height / 5
+    initial_gap = initial_width / 3
+    bar_height = np.full(frames, float(final_height))
+    bar_width = np.full(frames, final_width)
+    gap = np.full(frames, final_gap)
+    bar_height[:grow_frames] = (initial_height + (final_height - initial_height) * fraction).astype(int)
+    bar_width[:grow_frames] = (initial_width + (final_width - initial_width) * fraction).astype(int)
+    gap[:grow_frames] = (initial_gap + (final_gap - initial_gap) * fraction).astype(int)
+
+    # Bars side by side around the center of the screen
+    index = np.arange(count)
+    x = (width / 2 - (count * bar_width + (count - 1) * gap) / 2)[:, None] + (bar_width + gap)[:, None] * index
+    y = np.repeat((height / 2 - bar_height / 2)[:, None], count, axis=1)
+
+    # Moving off the screen
+    moving = np.zeros(frames)
+    moving[grow_frames + hold_frames:] = np.arange(move_frames) * period
+    directions = np.array(params['directions'], dtype=float)
+    if params['axis'] == 'x':
+        step = (width / 2 + final_width + final_gap) / 45
+        x += (step / (10 * loop_period) * moving ** 2 / 2)[:, None] * directions
+    else:
+        step = (height / 2 + final_height + final_gap) / 45
+        y += (step / (10 * loop_period) * moving ** 2 / 2)[:, None] * directions
+
+    # Clipped to the screen, bars that are off the screen are empty
+    left = np.floor(x)
+    top = np.floor(y)
+    right = np.clip(left + bar_width.astype(int)[:, None], 0, width)
+    bottom = np.clip(top + bar_height.astype(int)[:, None], 0, height)
+    left = np.clip(left, 0, width)
+    top = np.clip(top, 0, height)
+    rects = np.zeros((frames, count, 4), dtype=np.int32)
+    rects[..., 0] = left
+    rects[..., 1] = top
+    rects[..., 2] = np.maximum(right - left, 0)
+    rects[..., 3] = np.maximum(bottom - top, 0)
+    return {'rects': rects, 'phase': phase.astype(np.int8)}
+
+
+# Compiled spec, from memory, the disk cache or compiled now
+def compiled(spec, width, height, frame_rate=None):
+    params = {**full_spec(spec), 'version': version, 'width': width, 'height': height,
+              'frame_rate': frame_rate or Visual_Stimulus_One_Bar.frame_rate}
+    name = Stim_cache.key('bars', params)
+    if name not in sequences:
+        sequence = dict(Stim_cache.get('bars', params, compile_bars))
+        rects = sequence['rects']
+        sequence['params'] = params
+        sequence['frame_rects'] = [[pygame.Rect(*rect) for rect in frame] for frame in rects.tolist()]
+        # Counts the frames that look different from the one before, frames with the same count don't need drawing
+        changed = np.ones(len(rects), dtype=bool)
+        changed[1:] = np.any(rects[1:] != rects[:-1], axis=(1, 2))
+        sequence['changes'] = np.cumsum(changed)
+        sequences[name] = sequence
+    return sequences[name]
+
+
+# Plays a spec with colors (one per bar) on screen (a pygame display surface or a Stim_renderer.TextureScreen)
+def play(spec, colors, screen, width, height, background_white=True, frame_rate=None):
+    global frame_stats
+    sequence = compiled(spec, width, height, frame_rate)
+    params = sequence['params']
+    frame_rects = sequence['frame_rects']
+    changes = sequence['changes']
+    colors = [tuple(color) for color in colors]
+
+    background = Visual_Stimulus_One_Bar.background_surface(background_white, screen, height, width)
+    Visual_Stimulus_One_Bar.show_background(background_white, screen, height, width)
+    time.sleep(params['blank'])
+
+    # Frames that look like the one on the display (hold phase) aren't drawn again
+    last = None
+
+    def draw(frame):
+        nonlocal last
+        if last is not None and changes[frame] == changes[last]:
+            return False
+        Visual_Stimulus_One_Bar.draw_rects(screen, frame_rects[frame], colors, background)
+        last = frame
+        return True
+
+    frame_stats = Visual_Stimulus_One_Bar.play_frames(len(frame_rects), draw, screen, params['frame_rate'])
+
+    # Updating the screen with the background
+    Visual_Stimulus_One_Bar.show_background(background_white, screen, height, width)
+    time.sleep(params['blank'])
@@ -0,0 +1,76 @@
+import hashlib # python version
+import json # python version
+import os # python version
+import numpy as np # 1.26.4
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# hashlib, json, os: Python version
+# numpy: 1.26.4
+
+# Disk cache of compiled stimulus sequences.
+# A compiled sequence is a dict of numpy arrays with everything playback needs frame by frame (for example the
+# rectangle of every bar on every frame, the bar colors and the LED state), so a trigger only blits.
+# Sequences are keyed by the kind of stimulus and its parameters, and kept in memory and in cache_dir as .npz:
+#   sequence = Stim_cache.get('one_bar', {'speed': 2, ...}, build)
+# build(params) is only called when the sequence isn't cached yet. Changing how a stimulus is compiled has to
+# change version (or the stimulus' own version in params), so old files aren't played anymore.
+
+# CHANGE the folder of the compiled stimuli here
+cache_dir = "stimulus_cache"
+
+# Format of the cache files
+version = 1
+
+_memory = {}
+
+
+# Name of the sequence: kind + hash of the parameters
+def key(kind, params):
+    text = json.dumps({'version': version, 'kind': kind, 'params': params}, sort_keys=True, default=str)
+    return f"{kind}_{hashlib.sha1(text.encode()).hexdigest()[:16]}"
+
+
+def path(kind, params):
+    return os.path.join(cache_dir, key(kind, params) + '.npz')
+
+
+# Compiled sequence from memory, disk or build(params), in that order
+def get(kind, params, build):
+    name = key(kind, params)
+    if name in _memory:
+        return _memory[name]
+    sequence = load(kind, params)
+    if sequence is None:
+        sequence = build(params)
+        save(kind, params, sequence)
+    _memory[name] = sequence
+    return sequence
+
+
+def load(kind, params):
+    file_path = path(kind, params)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with np.load(file_path) as data:
+            # The parameters are stored too, so a hash collision or an old file is never played
+            if int(data['_version']) != version or str(data['_params']) != json.dumps(params, sort_keys=True, default=str):
+                return None
+            return {name: data[name] for name in data.files if not name.startswith('_')}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save(kind, params, sequence):
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = path(kind, params)
+    # Written under another name first, so a session that is killed while saving doesn't leave half a file
+    temporary = file_path + '.tmp.npz'
+    np.savez_compressed(temporary, _version=version, _params=json.dumps(params, sort_keys=True, default=str), **sequence)
+    os.replace(temporary, file_path)
+
+
+# Forgets the sequences kept in memory (the files stay)
+def clear_memory():
+    _memory.clear()
@@ -0,0 +1,244 @@
+import argparse # python version
+import json # python version
+import multiprocessing # python version
+import os # python version
+import threading # python version
+import time # python version
+import numpy as np # 1.26.4
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# argparse, json, multiprocessing, os, threading, time: Python version
+# numpy: 1.26.4
+
+# Runs the bar stimulus (Visual_Stimulus_One_Bar) in its own process, so drawing and the capture / detection loop
+# don't compete for the GIL of one interpreter.
+# The two processes talk over a pipe:
+#   to the stimulus process:  ('trigger', stimulus parameters), ('background', background_white), ('stop',)
+#   back from it:             ('ready',), ('leds', flip time, [(LED, on), ...]), ('done', result)
+# All times are time.monotonic(), which is the same clock in both processes.
+# The GPIO board can only be opened by one process, so the LED changes of every frame come back with the time of
+# the flip and the main process switches them (on_leds).
+#
+# python Stim_process.py --bench compares the trigger to first frame latency of the stimulus in a thread and in a
+# process while the main interpreter is busy like the detection loop (SDL's dummy driver if there is no display).
+
+# Called by the reader thread of the main process when it starts (Main_code.py sets its scheduling role here)
+on_thread_start = None
+
+# Longest time the idle stimulus process waits for a message before it looks at the window events (seconds)
+idle_timeout = 0.1
+
+
+# Waits until the time.monotonic() deadline: sleeps most of the way and spins for the last 2 ms
+# (also used by Main_code.py when the stimulus runs in its thread)
+def wait_until(deadline):
+    if deadline is None:
+        return
+    remaining = deadline - time.monotonic()
+    if remaining > 0.002:
+        time.sleep(remaining - 0.002)
+    while time.monotonic() < deadline:
+        pass
+
+
+# The stimulus loop, in the stimulus process (or a thread for the benchmark).
+# settings: width, height, duration, color, display, fullscreen, background_white, role, backend ('surface' / 'texture')
+def serve(conn, settings):
+    import pygame # 2.6.0
+    import Sched_profile
+    import Visual_Stimulus_One_Bar
+
+    if settings.get('role'):
+        Sched_profile.apply_role(settings['role'])
+    width, height = settings['width'], settings['height']
+    color = tuple(settings['color'])
+    pygame.init()
+    if settings.get('backend') == 'texture':
+        import Stim_renderer
+        screen = Stim_renderer.TextureScreen(width, height, display=settings.get('display', 0))
+    else:
+        flags = pygame.NOFRAME if settings.get('fullscreen', True) else 0
+        screen = pygame.display.set_mode((width, height), flags=flags, display=settings.get('display', 0))
+    Visual_Stimulus_One_Bar.prepare(settings['duration'], height, width, color, screen, settings.get('display', 0))
+    background_white = settings.get('background_white', False)
+    Visual_Stimulus_One_Bar.show_background(background_white, screen, height, width)
+
+    def led_sink(t, changes):
+        conn.send(('leds', t, changes))
+
+    conn.send(('ready',))
+    running = True
+    while running:
+        if conn.poll(idle_timeout):
+            message = conn.recv()
+            if message[0] == 'stop':
+                running = False
+            elif message[0] == 'background':
+                background_white = message[1]
+            elif message[0] == 'trigger':
+                params = message[1]
+                wait_until(params.get('onset_at'))
+                start = time.monotonic()
+                Visual_Stimulus_One_Bar.animation(settings['duration'], params['speed'], params['direction'], height, width, color,
+                                                  params['background_white'], screen, None, params.get('wait_time'), led_sink=led_sink)
+                conn.send(('done', {'started': start, 'onset': Visual_Stimulus_One_Bar.onset_time,
+                                    'frames': Visual_Stimulus_One_Bar.frame_stats}))
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+        Visual_Stimulus_One_Bar.show_background(background_white, screen, height, width)
+    pygame.quit()
+    conn.send(('stopped',))
+
+
+class StimulusProcess:
+
+    # on_leds(flip time, [(LED, on), ...]) and on_done(result) are called from the reader thread of the main process
+    def __init__(self, settings, on_leds=None, on_done=None, thread=False):
+        self.settings = settings
+        self.on_leds = on_leds
+        self.on_done = on_done
+        # thread=True runs serve() in a thread of this process instead (for comparing the two)
+        self.thread = thread
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.triggered = None
+        self._conn = None
+        self._send_lock = threading.Lock()
+
+    def start(self):
+        if self.thread:
+            self._conn, child = multiprocessing.Pipe()
+            self.worker = threading.Thread(target=serve, args=(child, self.settings), name="stimulus", daemon=True)
+        else:
+            # spawn: the stimulus process starts from a clean interpreter instead of a fork of the threaded main process
+            context = multiprocessing.get_context('spawn')
+            self._conn, child = context.Pipe()
+            self.worker = context.Process(target=serve, args=(child, self.settings), name="stimulus", daemon=True)
+        self.worker.start()
+        self._reader = threading.Thread(target=self._read, name="stimulus-reader", daemon=True)
+        self._reader.start()
+
+    def _send(self, message):
+        with self._send_lock:
+            self._conn.send(message)
+
+    # Starts a stimulus, returns right away. params: speed, direction, background_white, onset_at, wait_time
+    def trigger(self, params):
+        self.done.clear()
+        self.triggered = time.monotonic()
+        self._send(('trigger', {key: params.get(key) for key in ('speed', 'direction', 'background_white', 'onset_at', 'wait_time')}))
+
+    def set_background(self, background_white):
+        self._send(('background', background_white))
+
+    # Waits for the end of the stimulus, returns its result (started, onset, frames) or None
+    def wait_done(self, timeout=None):
+        if self.done.wait(timeout):
+            return self.result
+        return None
+
+    def stop(self, timeout=2):
+        if self._conn is None:
+            return
+        try:
+            self._send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+        self.worker.join(timeout)
+        if not self.thread and self.worker.is_alive():
+            self.worker.terminate()
+        self._conn = None
+
+    def _read(self):
+        if on_thread_start is not None:
+            on_thread_start()
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError, AttributeError):
+                break
+            if message[0] == 'ready':
+                self.ready.set()
+            elif message[0] == 'leds':
+                if self.on_leds is not None:
+                    self.on_leds(message[1], message[2])
+            elif message[0] == 'done':
+                self.result = message[1]
+                self.done.set()
+                if self.on_done is not None:
+                    self.on_done(message[1])
+            elif message[0] == 'stopped':
+                break
+
+
+# BENCHMARK
+# Busy Python code in the main interpreter, like the detection loop (holds the GIL most of the time)
+# counter[0] counts the iterations, the rate shows how much the stimulus slows the main interpreter down
+def busy(stop, counter):
+    frame = np.zeros((270, 360), np.uint8)
+    while not stop.is_set():
+        total = 0
+        for value in range(2000):
+            total += value * value
+        frame.sum()
+        counter[0] += 1
+
+
+def bench(mode, settings, triggers, load):
+    stimulus = StimulusProcess(settings, thread=(mode == 'thread'))
+    stimulus.start()
+    if not stimulus.ready.wait(30):
+        raise RuntimeError("stimulus didn't start")
+    stop = threading.Event()
+    counter = [0]
+    workers = [threading.Thread(target=busy, args=(stop, counter), daemon=True) for _ in range(load)]
+    for worker in workers:
+        worker.start()
+    start = time.monotonic()
+    latencies = []
+    missed = []
+    for index in range(triggers):
+        time.sleep(0.2)
+        stimulus.trigger({'speed': index % 3, 'direction': ('left', 'right')[index % 2], 'background_white': False})
+        result = stimulus.wait_done(settings['duration'] + 10)
+        if result is None or result['onset'] is None:
+            continue
+        latencies.append(result['onset'] - stimulus.triggered)
+        missed.append(result['frames']['missed'])
+    stop.set()
+    busy_rate = counter[0] / (time.monotonic() - start)
+    stimulus.stop()
+    latencies = np.array(latencies) * 1000
+    return {'triggers': len(latencies), 'latency_ms_mean': round(float(latencies.mean()), 3),
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)), 3), 'latency_ms_max': round(float(latencies.max()), 3),
+            'missed_frames_mean': round(float(np.mean(missed)), 2), 'main_loop_iterations_per_s': round(busy_rate, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stimulus in its own process")
+    parser.add_argument('--bench', action='store_true', help="compare trigger latency of the threaded and the process stimulus")
+    parser.add_argument('--triggers', type=int, default=10)
+    parser.add_argument('--load', type=int, default=1, help="busy threads in the main interpreter during the benchmark")
+    parser.add_argument('--output', help="also write the JSON results to this file")
+    args = parser.parse_args()
+    if not args.bench:
+        parser.print_help()
+        return
+    if 'DISPLAY' not in os.environ and 'WAYLAND_DISPLAY' not in os.environ:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    # Short stimulus, every trigger also waits for the 2 s pause at the end of animation()
+    settings = {'width': 1920, 'height': 1080, 'duration': 0.5, 'color': [255, 0, 0], 'display': 0, 'fullscreen': False}
+    report = {'load_threads': args.load}
+    for mode in ('thread', 'process'):
+        report[mode] = bench(mode, settings, args.triggers, args.load)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
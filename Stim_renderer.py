@@ -0,0 +1,94 @@
+import time # python version
+import pygame # 2.6.0
+from pygame._sdl2 import video # 2.6.0
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# time: Python version
+# pygame: 2.6.0
+
+# SDL2 texture backend for the bar stimulus (Visual_Stimulus_One_Bar), instead of drawing into the display surface.
+# The backgrounds and one texture per bar color are uploaded once, every frame is the background texture plus the
+# bar textures stretched to their rectangles, so moving a bar only changes a destination rectangle.
+# With a GPU the copies run on the GPU, without one SDL's software renderer is used (accelerated=0).
+# A TextureScreen is passed to animation() / draw_rects() / show_background() in place of the pygame screen:
+#   screen = Stim_renderer.TextureScreen(1920, 1080, display=1)
+#   Visual_Stimulus_One_Bar.animation(..., screen, pins, ...)
+
+# SDL_WINDOWPOS_UNDEFINED_DISPLAY(display): opens the window on that display
+def window_position(display):
+    return 0x1FFF0000 | display
+
+
+class TextureScreen:
+
+    # renderer: 'auto' (GPU if there is one, else software), 'gpu' or 'software'
+    # vsync: flip() waits for the vertical blank of the display, so every frame is on screen for one refresh
+    def __init__(self, width, height, display=0, renderer='auto', vsync=True, title="Stimulus"):
+        self.width = width
+        self.height = height
+        self.display = display
+        self.vsync = vsync
+        position = window_position(display)
+        self.window = video.Window(title, size=(width, height), position=(position, position), borderless=True)
+        self.renderer = None
+        attempts = {'auto': (-1, 0), 'gpu': (1,), 'software': (0,)}[renderer]
+        error = None
+        for accelerated in attempts:
+            try:
+                self.renderer = video.Renderer(self.window, accelerated=accelerated, vsync=vsync)
+                self.accelerated = accelerated
+                break
+            except pygame.error as exception:
+                error = exception
+        if self.renderer is None:
+            raise error
+        self._bars = {}
+        if vsync and not self._flips_wait():
+            # Some drivers (SDL's dummy driver, software renderers) ignore vsync, the stimulus then times the frames itself
+            self.vsync = False
+
+    # Presents a few frames: with working vsync they are a refresh apart (no display refreshes faster than 500 Hz)
+    def _flips_wait(self, flips=5):
+        self.renderer.clear()
+        start = time.monotonic()
+        for _ in range(flips):
+            self.renderer.present()
+        return (time.monotonic() - start) / flips > 0.002
+
+    def get_rect(self):
+        return pygame.Rect(0, 0, self.width, self.height)
+
+    def get_bitsize(self):
+        return 32
+
+    # Uploads a surface (a background) as a texture
+    def texture(self, surface):
+        return video.Texture.from_surface(self.renderer, surface)
+
+    # 1 x 1 texture of a bar color, stretched to the bar rectangle
+    def bar_texture(self, color):
+        texture = self._bars.get(color)
+        if texture is None:
+            pixel = pygame.Surface((1, 1))
+            pixel.fill(color)
+            texture = self.texture(pixel)
+            self._bars[color] = texture
+        return texture
+
+    # Draws a frame into the back buffer: background texture and the bars (pygame.Rect, empty = not on screen)
+    # sprites: None, or (texture, area of the texture) per bar, drawn instead of the plain color
+    def draw_frame(self, background, rects, colors, sprites=None):
+        background.draw()
+        for index, (rect, color) in enumerate(zip(rects, colors)):
+            if rect.width and rect.height:
+                if sprites is None:
+                    self.bar_texture(color).draw(dstrect=rect)
+                else:
+                    sprites[index][0].draw(srcrect=sprites[index][1], dstrect=rect)
+
+    def flip(self):
+        self.renderer.present()
+
+    def close(self):
+        self.window.destroy()
@@ -1,164 +1,444 @@
 import pygame # 2.6.0
+import ctypes # python version
+import re # python version
 import time # python version   
+import numpy as np # 1.26.4
 import IR_LED 
+import Stim_cache
 
 white = (255, 255, 255)
 gray = (133, 132, 131)
 
+# time.monotonic() right after the first bar frame of the last animation was flipped
+onset_time = None
+# time.monotonic() right after the last flip
+flip_time = None
+
+# The background is drawn once per (background, size) into a surface in the format of the display and copied from there.
+# Every bar frame only restores the strips the bars covered on the last frame, draws the bars and updates these
+# rectangles of the display instead of redrawing and flipping all of it.
+backgrounds = {}
+# Areas of the screen covered by bars on the last frame, empty when the screen only shows the background
+bar_rects = []
+
 # Function to draw the bar
 def bar_drawing(screen, bar, background_white, height, width):
-    draw_background(background_white, screen, height, width)
-
     # For the bar, draw based on the color, position, current width and height 
-    pygame.draw.rect(screen, bar['color'], (*bar['pos'], bar['width'], bar['height']))
-    pygame.display.flip()
+    rect = screen.get_rect().clip(pygame.Rect(int(bar['pos'][0]), int(bar['pos'][1]), int(bar['width']), int(bar['height'])))
+    draw_rects(screen, [rect], [bar['color']], background_surface(background_white, screen, height, width))
+
+
+# Draws a frame of bars: rects (pygame.Rect, already clipped to the screen, empty = not on screen) with colors
+# sprites: None, or (sprite, area of the sprite) per bar, copied to the rect instead of filling it with the color
+def draw_rects(screen, rects, colors, background, sprites=None):
+    global onset_time, flip_time, bar_rects
+    if not isinstance(screen, pygame.Surface):
+        # Texture backend (Stim_renderer.TextureScreen): the whole frame is composed from textures
+        screen.draw_frame(background, rects, colors, sprites)
+        screen.flip()
+        bar_rects = [rect for rect in rects if rect.width and rect.height]
+        flip_time = time.monotonic()
+        if onset_time is None:
+            onset_time = flip_time
+        return
+    # Background under the bars of the last frame, all strips in one blits() call
+    dirty = bar_rects
+    screen.blits([(background, rect, rect) for rect in dirty], doreturn=False)
+    bar_rects = [rect for rect in rects if rect.width and rect.height]
+    if sprites is None:
+        for rect, color in zip(rects, colors):
+            if rect.width and rect.height:
+                screen.fill(color, rect)
+    else:
+        screen.blits([(sprite, rect, area) for rect, (sprite, area) in zip(rects, sprites) if rect.width and rect.height], doreturn=False)
+    pygame.display.update(merge_rects(dirty + bar_rects))
+    flip_time = time.monotonic()
+    if onset_time is None:
+        onset_time = flip_time
+
+
+# Joins overlapping rectangles, so no part of the display is updated twice
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect = rect.union(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+# Background in the pixel format of the screen, drawn the first time it's needed
+# (a texture of the renderer with the texture backend)
+def background_surface(background_white, screen, height, width):
+    textured = not isinstance(screen, pygame.Surface)
+    key = (background_white, width, height, screen.get_bitsize(), id(screen) if textured else None)
+    surface = backgrounds.get(key)
+    if surface is None:
+        surface = pygame.Surface((width, height))
+        # White if it is true
+        surface.fill(white)
+        # Half White & Half Gray if it is not 
+        if not background_white:
+            pygame.draw.rect(surface, gray, (0, height /2, width, height /2))
+        surface = screen.texture(surface) if textured else surface.convert(screen)
+        backgrounds[key] = surface
+    return surface
 
 
 # Function to get background
 def draw_background(background_white, screen, height, width):
-    # White if it is true
-    if background_white:
-        screen.fill(white)
+    global bar_rects, shown
+    if isinstance(screen, pygame.Surface):
+        screen.blit(background_surface(background_white, screen, height, width), (0, 0))
+    else:
+        screen.draw_frame(background_surface(background_white, screen, height, width), [], [])
+    bar_rects = []
+    # Not on the display until it's flipped
+    shown = None
+
+# Background that is on the display (without bars), None when it's unknown
+shown = None
+
+# Draws and flips the background, only if it isn't on the display already
+def show_background(background_white, screen, height, width):
+    global shown
+    key = (background_white, width, height, id(screen))
+    if shown == key and not bar_rects:
+        return False
+    draw_background(background_white, screen, height, width)
+    if isinstance(screen, pygame.Surface):
+        pygame.display.flip()
+    else:
+        screen.flip()
+    shown = key
+    return True
+
+
+
+# TRAJECTORIES
+# The position of the bar is a function of the time since the start of the animation, precomputed per
+# (duration, speed, direction, width) into a table, so the speed of the bar doesn't depend on how fast the loop runs.
+# The bar crosses distance = width + 1.5 bar widths in each phase:
+#   speed 0: one phase, speed 1: there and back (two phases), speed 2: there, back and there again (three phases)
+# so the speed is number of phases * distance / duration px/s.
+# Frames per second of the stimulus: prepare() sets it to the refresh rate of the display mode.
+# CHANGE it here for displays that don't report their refresh rate (SDL's dummy driver, some projectors),
+# prepare() keeps it then
+frame_rate = 60
+# Time between two entries of the trajectory tables (seconds)
+table_step = 0.001
+# Trajectory tables: key -> (times, x, movement direction -1 / +1)
+trajectories = {}
+# Frames drawn and missed (not drawn on time) by the last animation
+frame_stats = {}
+
+
+# Position of the left edge of the bar and its movement direction for every table_step of the animation
+def trajectory(duration, speed, direction, width):
+    key = (duration, speed, direction, width)
+    if key in trajectories:
+        return trajectories[key]
+    final_width = width * 1.125 / 5
+    distance = width + final_width + final_width / 2
+    phases = np.array([1, -1, 1][:speed + 1])
+    sign = -1 if direction == 'left' else 1
+    x0 = width if direction == 'left' else -final_width
+    phase_duration = duration / len(phases)
+    velocity = sign * len(phases) * distance / duration
+
+    times = np.linspace(0, duration, int(round(duration / table_step)) + 1)
+    phase = np.minimum((times / phase_duration).astype(int), len(phases) - 1)
+    # Position at the start of every phase
+    phase_start = x0 + velocity * phase_duration * np.concatenate(([0], np.cumsum(phases[:-1])))
+    x = phase_start[phase] + velocity * phases[phase] * (times - phase * phase_duration)
+    moving = sign * phases[phase]
+    trajectories[key] = (times, x, moving)
+    return trajectories[key]
+
+
+# COMPILED SEQUENCES
+# Every frame of a stimulus (bar rectangle clipped to the screen and direction of the movement) is computed once
+# per parameter combination and kept by Stim_cache in memory and on disk, so a trigger only plays it back.
+# prepare() compiles all of them and draws the backgrounds at the start of a session.
+# CHANGE when the way the sequences are computed changes, so the cached ones are rebuilt
+sequence_version = 2
+# Compiled sequences with the rectangles as pygame.Rect, key -> sequence
+sequences = {}
+
+# SUB-PIXEL MOTION
+# The bar is drawn from sprites rendered in advance at every 1 / subpixel_steps px offset, one pixel wider than the
+# bar, with the edge columns blended with the background by how much of them the bar covers. Slow bars then move
+# smoothly instead of in whole-pixel jumps, and a frame is still one copy. subpixel_steps = 1 draws whole pixels
+subpixel_steps = 4
+# Sprite sets: key -> one surface (or texture) per offset
+sprite_sets = {}
+
+
+def sequence_params(duration, speed, direction, height, width, color_selected, background_white):
+    return {'version': sequence_version, 'duration': duration, 'speed': speed, 'direction': direction,
+            'height': height, 'width': width, 'color': list(color_selected), 'background_white': bool(background_white),
+            'frame_rate': frame_rate, 'subpixel_steps': subpixel_steps}
+
+
+# Frames of one stimulus at frame_rate, from its trajectory
+def compile_sequence(params):
+    times, positions, movement = trajectory(params['duration'], params['speed'], params['direction'], params['width'])
+    period = 1 / params['frame_rate']
+    frames = int(params['duration'] / period + 1e-9) + 1
+    index = np.minimum(np.round(np.arange(frames) * period / table_step).astype(int), len(times) - 1)
+    x = positions[index]
+    final_height = params['width'] * 1.125
+    final_width = final_height / 5
+    steps = params['subpixel_steps']
+    if steps > 1:
+        # Whole pixel and offset (in 1 / steps px) of the left edge, the sprites are one pixel wider than the bar
+        shifted = np.round(x * steps).astype(np.int64)
+        whole = np.floor_divide(shifted, steps)
+        sprite = shifted - whole * steps
+        sprite_width = int(final_width) + 1
+    else:
+        # Same truncation as pygame.draw.rect
+        whole = x.astype(np.int64)
+        sprite = np.zeros(frames, dtype=np.int64)
+        sprite_width = int(final_width)
+    # Clipped to the screen, offset is where the visible part starts in the sprite
+    left = np.clip(whole, 0, params['width'])
+    right = np.clip(whole + sprite_width, 0, params['width'])
+    rects = np.zeros((frames, 1, 4), dtype=np.int32)
+    rects[:, 0, 0] = left
+    rects[:, 0, 2] = right - left
+    rects[:, 0, 3] = min(int(final_height), params['height'])
+    return {
+        'rects': rects,
+        'colors': np.array([params['color']], dtype=np.uint8),
+        'sprites': sprite.reshape(frames, 1).astype(np.int8),
+        'offsets': (left - whole).reshape(frames, 1).astype(np.int32),
+        'movement': movement[index].astype(np.int8),
+        'x': x,
+        'speed_px_s': np.array(abs(positions[1] - positions[0]) / table_step),
+    }
+
+
+# Compiled sequence, from memory, the disk cache or compiled now
+def compiled(duration, speed, direction, height, width, color_selected, background_white):
+    params = sequence_params(duration, speed, direction, height, width, color_selected, background_white)
+    name = Stim_cache.key('one_bar', params)
+    if name not in sequences:
+        sequence = dict(Stim_cache.get('one_bar', params, compile_sequence))
+        sequence['frame_rects'] = [[pygame.Rect(*rect) for rect in frame] for frame in sequence['rects'].tolist()]
+        sequence['frame_colors'] = [tuple(color) for color in sequence['colors'].tolist()]
+        # Part of the sprite that is visible on every frame
+        sequence['frame_areas'] = [[pygame.Rect(offset, 0, rect.width, rect.height) for offset, rect in zip(offsets, rects)]
+                                   for offsets, rects in zip(sequence['offsets'].tolist(), sequence['frame_rects'])]
+        sequences[name] = sequence
+    return sequences[name]
+
+
+# Bar sprites at every 1 / steps px offset for a color and background (surfaces in the screen format or textures)
+def bar_sprites(color_selected, background_white, screen, height, width, steps=None):
+    steps = steps or subpixel_steps
+    textured = not isinstance(screen, pygame.Surface)
+    key = (tuple(color_selected), background_white, width, height, steps, screen.get_bitsize(), id(screen) if textured else None)
+    if key in sprite_sets:
+        return sprite_sets[key]
+    bar_width = int(width * 1.125 / 5)
+    bar_height = min(int(width * 1.125), height)
+    # One column of the background, drawn like the background itself
+    column = pygame.Surface((1, height))
+    column.fill(white)
+    if not background_white:
+        pygame.draw.rect(column, gray, (0, height /2, 1, height /2))
+    column = pygame.surfarray.array3d(column)[:, :bar_height].astype(np.float32)
+    color = np.array(color_selected[:3], dtype=np.float32)
+
+    sprites = []
+    for step in range(steps):
+        offset = step / steps
+        # How much of each pixel column the bar covers
+        coverage = np.ones(bar_width + 1, dtype=np.float32)
+        coverage[0] = 1 - offset
+        coverage[-1] = offset
+        pixels = column * (1 - coverage[:, None, None]) + color * coverage[:, None, None]
+        sprite = pygame.surfarray.make_surface(np.round(pixels).astype(np.uint8))
+        sprites.append(screen.texture(sprite) if textured else sprite.convert(screen))
+    sprite_sets[key] = sprites
+    return sprites
+
+
+# SDL_DisplayMode of SDL_video.h
+class _DisplayMode(ctypes.Structure):
+    _fields_ = [('format', ctypes.c_uint32), ('w', ctypes.c_int), ('h', ctypes.c_int),
+                ('refresh_rate', ctypes.c_int), ('driverdata', ctypes.c_void_p)]
 
-    # Half White & Half Gray if it is not 
+
+# Refresh rate (Hz) of the current mode of a display, 0 when the display doesn't report it.
+# pygame 2.6 has no call for it, so it's asked from the SDL library pygame has loaded (SDL_GetCurrentDisplayMode)
+def display_refresh_rate(display=0):
+    if hasattr(pygame.display, 'get_desktop_refresh_rates'):
+        rates = pygame.display.get_desktop_refresh_rates()
+        return rates[display] if display < len(rates) else 0
+    try:
+        with open('/proc/self/maps') as maps:
+            paths = [line.split()[-1] for line in maps if re.search(r'/libSDL2-2[.-]', line)]
+        if not paths:
+            return 0
+        mode = _DisplayMode()
+        if ctypes.CDLL(paths[0]).SDL_GetCurrentDisplayMode(display, ctypes.byref(mode)) != 0:
+            return 0
+        return mode.refresh_rate
+    except OSError:
+        return 0
+
+
+# Compiles every speed / direction / background and draws the backgrounds and sprites, called once the display is open
+# display: index of the stimulus display, its refresh rate becomes frame_rate
+def prepare(duration, height, width, color_selected, screen, display=0):
+    global frame_rate
+    rate = display_refresh_rate(getattr(screen, 'display', display))
+    if rate > 0:
+        frame_rate = rate
     else:
-        screen.fill(white)
-        pygame.draw.rect(screen, gray, (0, height /2, width, height /2))
+        print(f"Display refresh rate unknown, stimulus frames at frame_rate = {frame_rate}")
+    for background_white in (True, False):
+        background_surface(background_white, screen, height, width)
+        if subpixel_steps > 1:
+            bar_sprites(color_selected, background_white, screen, height, width)
+        for speed in (0, 1, 2):
+            for direction in ('left', 'right'):
+                compiled(duration, speed, direction, height, width, color_selected, background_white)
+
+
+# Pins of the stimulus LEDs by name
+def led_pins_of(pins, pattern=None):
+    if pattern is not None:
+        return {'left': pattern["Left"], 'right': pattern["Right"], 'speed_0': pattern["Speed"][0], 'speed_1': pattern["Speed"][1]}
+    return {'left': pins[0], 'right': pins[1], 'speed_0': pins[3], 'speed_1': pins[4]}
+
+
+# FRAME CLOCK
+# Plays count frames at rate (default frame_rate): frame k is due at start + k / rate, draw(k) draws and flips it and
+# returns whether it did (False: the frame looks like the one on the display and wasn't drawn).
+# With vsync (Stim_renderer.TextureScreen) the flips set the pace: a frame is drawn right away and the flip waits for
+# the next vertical blank, the first flip is frame 0. Without it the loop waits for the time of the frame itself, the
+# last millisecond spinning. Frames whose time has already passed are skipped (the bars stay on their trajectories).
+# Returns the frame stats: frames drawn and missed, rate, vsync, backend and CPU time of drawing + presenting
+def play_frames(count, draw, screen, rate=None):
+    rate = rate or frame_rate
+    period = 1 / rate
+    vsync = getattr(screen, 'vsync', False)
+    frames = 0
+    missed = 0
+    frame = 0
+    cpu_times = []
+    start_time = None if vsync else time.monotonic()
+    while frame < count:
+        if start_time is not None:
+            # With vsync the flip after the blank before the frame's time shows it on time
+            target = start_time + (frame - 1 if vsync else frame) * period
+            remaining = target - time.monotonic()
+            if remaining > 0.001:
+                time.sleep(remaining - 0.001)
+            while time.monotonic() < target:
+                pass
+        cpu = time.thread_time()
+        drawn = draw(frame)
+        if not drawn:
+            frame += 1
+            continue
+        cpu_times.append(time.thread_time() - cpu)
+        frames += 1
 
+        # The frame times come from the flips, the next frame is the one due at the next flip
+        if start_time is None:
+            start_time = flip_time
+        due = int(round((flip_time - start_time) / period)) + 1 if vsync else int((flip_time - start_time) / period)
+        if due > frame + 1:
+            missed += due - frame - 1
+            frame = due
+        else:
+            frame += 1
+
+    cpu_ms = np.array(cpu_times) * 1000
+    return {'frames': frames, 'missed': missed, 'frame_rate': rate, 'vsync': vsync,
+            'backend': 'surface' if isinstance(screen, pygame.Surface) else 'texture',
+            'cpu_ms_mean': round(float(cpu_ms.mean()), 3), 'cpu_ms_p95': round(float(np.percentile(cpu_ms, 95)), 3)}
 
 
 # Function for three bar horizontal animation 
 # Parameters: duration, color, dimensions, speed, direction, background
-def animation(duration, speed , direction, height, width, color_selected, background_white, screen, pins, wait_time):
+# pattern: LED pins of Main_code.py ("Left", "Right", "Speed"), pins[0], pins[1], pins[3] & pins[4] without it
+# The LEDs are switched by the GPIO worker thread of IR_LED at the time of the flip of the frame they belong to,
+# the loop only queues the changes. The executed changes are in IR_LED.queue.pop_executed().
+# led_sink: instead of switching the pins, call led_sink(flip time, [(LED, True / False), ...]) with the LEDs
+# named 'left', 'right', 'speed_0', 'speed_1' (used when the GPIO board belongs to another process, pins can be None)
+# The frames of the compiled sequence are played by play_frames() at frame_rate (refresh rate of the display, see
+# prepare()). Frames that can't be drawn on time are skipped and counted in frame_stats['missed'].
+def animation(duration, speed , direction, height, width, color_selected, background_white, screen, pins, wait_time, pattern=None, led_sink=None):
+    global onset_time, frame_stats
+    onset_time = None
     
-    IR_LED.init(pins)
+    if led_sink is None:
+        # Opens the pins on the first animation, after that they are off from the end of the last one already
+        if IR_LED.bank is None or not all(IR_LED.bank.has(pin) for pin in pins):
+            IR_LED.init(pins)
+        gpio = IR_LED.start_queue()
+        led_pins = led_pins_of(pins, pattern)
+        led_sink = lambda t, changes: gpio.at(t, [(led_pins[name], value) for name, value in changes])
+    left, right, speed_leds = 'left', 'right', ['speed_0', 'speed_1']
 
-    final_height = width * 1.125
-    final_width = final_height / 5
-    
-    bar = {'color': color_selected, 'pos': [0,0], 'width': final_width, 'height': final_height}
+    # LED state wanted for the next frame, only the changes are sent
+    state = {}
+    pending = []
 
-    # Updating the screen with the white background 
-    print("Drawing background")
-    draw_background(background_white, screen, height, width)
-    pygame.display.flip()
+    def leds(changes):
+        for name, value in changes:
+            if state.get(name) != value:
+                state[name] = value
+                pending.append((name, value))
+
+    def send(t):
+        if pending:
+            led_sink(t, pending[:])
+            pending.clear()
+
+    # Updating the screen with the white background (already there when the stimulus thread was idle on it)
+    background = background_surface(background_white, screen, height, width)
+    if show_background(background_white, screen, height, width):
+        print("Drawing background")
 
     # time.sleep(wait_time)
 
-    # Moving left 
-    if(direction == 'left'):
-        print("Moving Left")
-        # Final bar positions
-        bar["pos"][0] = width
-        print(bar["pos"][0])
-        bar_drawing(screen, bar, background_white, height, width)
-        pygame.time.delay(10)
-
-        print(( (width + final_width + final_width / 2 ) / duration ) / 95 * 3)
-        # Moving off Screen animation 
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            # Updating the position of the bars
-            if speed == 0:
-                bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 91.25
-                IR_LED.LED_on(pins[0]) 
-                bar_drawing(screen, bar, background_white, height, width)
-                pygame.time.delay(10)
-            
-            elif speed == 1:
-                IR_LED.LED_on(pins[3])
-                if (time.time() - start_time < duration/2):
-                    bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 93 * 2
-                    IR_LED.LED_off(pins[1])
-                    IR_LED.LED_on(pins[0])
-                else:
-                    bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 93 * 2
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-                bar_drawing(screen, bar, background_white, height, width)
-                pygame.time.delay(10)
-            
-            elif speed == 2:
-                IR_LED.LED_on(pins[3])
-                IR_LED.LED_on(pins[4])
-                if (time.time() - start_time < duration/3):
-                    bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 95 * 3
-                    IR_LED.LED_off(pins[1])
-                    IR_LED.LED_on(pins[0])
-                elif (time.time() - start_time < 2*duration/3):
-                    bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 95 * 3
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-                else:
-                    bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 91.25 * 3
-                    IR_LED.LED_off(pins[1])
-                    IR_LED.LED_on(pins[0])
-
-                bar_drawing(screen, bar, background_white, height, width)
-                pygame.time.delay(10)
-        
-        IR_LED.init(pins)           
-        print("Finished duration")
-        print(bar["pos"][0], bar["pos"][1])
-    
-    # Moving Right 
-    elif(direction == 'right'):
-        print("Moving Right")
-        # Final bar positions
-        bar["pos"][0] = 0 - (final_width)
-        print(bar["pos"][0])
-
-        # Moving off Screen animation 
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            # Updating the position of the bars
-            if speed == 0:
-                bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 91.25
-                bar_drawing(screen, bar, background_white, height, width)
-                IR_LED.LED_on(pins[1]) 
-                pygame.time.delay(10)
-            
-            elif speed == 1:
-                IR_LED.LED_on(pins[3])
-                if (time.time() - start_time < duration/2):
-                    bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 93 * 2
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-
-                else:
-                    bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 93 * 2
-                    IR_LED.LED_off(pins[1])
-                    IR_LED.LED_on(pins[0])
-
-                bar_drawing(screen, bar, background_white, height, width)
-                pygame.time.delay(10)
-            
-            elif speed == 2:
-                IR_LED.LED_on(pins[3])
-                IR_LED.LED_on(pins[4])
-                if (time.time() - start_time < duration/3):
-                    bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 93 * 3
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-                elif (time.time() - start_time < 2*duration/3):
-                    bar['pos'][0] -= ( (width + final_width + final_width / 2 ) / duration ) / 93 * 3
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-                else:
-                    bar['pos'][0] += ( (width + final_width + final_width / 2 ) / duration ) / 91.25 * 3
-                    IR_LED.LED_off(pins[0])
-                    IR_LED.LED_on(pins[1])
-
-                bar_drawing(screen, bar, background_white, height, width)
-                pygame.time.delay(10)
-
-        IR_LED.init(pins)
+    if direction in ('left', 'right'):
+        print("Moving Left" if direction == 'left' else "Moving Right")
+        sequence = compiled(duration, speed, direction, height, width, color_selected, background_white)
+        frame_rects = sequence['frame_rects']
+        colors = sequence['frame_colors']
+        movement = sequence['movement']
+        frame_sprites = [None] * len(frame_rects)
+        if subpixel_steps > 1:
+            sprite_set = bar_sprites(color_selected, background_white, screen, height, width)
+            frame_sprites = [[(sprite_set[sprite], area) for sprite, area in zip(sprites, areas)]
+                             for sprites, areas in zip(sequence['sprites'].tolist(), sequence['frame_areas'])]
+        # The speed LEDs show the speed (none, one or two), the direction LEDs where the bar is moving
+        leds([(name, index < speed) for index, name in enumerate(speed_leds)])
+
+        # The direction LEDs of a frame switch at its flip
+        def draw(frame):
+            leds([(left, bool(movement[frame] < 0)), (right, bool(movement[frame] > 0))])
+            draw_rects(screen, frame_rects[frame], colors, background, frame_sprites[frame])
+            send(flip_time)
+            return True
+
+        stats = play_frames(len(frame_rects), draw, screen)
+
+        leds([(name, False) for name in (left, right, *speed_leds)])
+        send(time.monotonic())
+        frame_stats = {**stats, 'speed_px_s': round(float(sequence['speed_px_s']), 1)}
         print("Finished duration")
-        
+        print(sequence['x'][len(frame_rects) - 1])
     
     # Updating the screen with the white background 
-    draw_background(background_white, screen, height, width)
-    pygame.display.flip()
+    show_background(background_white, screen, height, width)
     time.sleep(2)
-
-
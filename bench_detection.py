@@ -0,0 +1,190 @@
+import argparse # python version
+import glob # python version
+import json # python version
+import os # python version
+import re # python version
+from time import perf_counter # python version
+import cv2 # 4.10.0.84
+import numpy as np # 1.26.4
+import Background_model
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# opencv-python: 4.10.0.84
+# numpy: 1.26.4
+
+# Benchmark of the motion detection on replayed trials, no cameras needed.
+# Runs the same frames through a background model that updates on every frame (like before) and through
+# the throttled model (Background_model.update_every), and compares:
+#   - time per frame of the background model and of the whole detection (mean, 95th percentile)
+#   - detection quality against the full update model: agreement of "motion detected", centroid error, mask IoU
+#   - on the synthetic arena, the detection quality of both models against the known position of the blob:
+#     detection rate, false detections, centroid error and IoU of the mask with the blob
+# Usage:
+#   python bench_detection.py /path/to/DATA/main_images_XXX_a     (a trial saved by Main_code.py)
+#   python bench_detection.py                                     (synthetic arena with a moving insect and a lighting change)
+# The results are printed as JSON (and written to --output if given).
+
+# Same values as Main_code.py
+kernel = np.ones((30, 30), np.uint8)
+min_contour_area = 100
+
+
+# Loads the frames of a saved trial in frame order
+def load_trial(folder, limit=None):
+    paths = glob.glob(os.path.join(folder, 'frame_*.bmp'))
+    paths.sort(key=lambda path: int(re.findall(r'frame_(\d+)_', os.path.basename(path))[0]))
+    if limit:
+        paths = paths[:limit]
+    return [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in paths]
+
+
+# Radius of the blob of the synthetic arena
+blob_radius = 25
+
+
+# Noisy arena (1440 x 1080) with a dark blob moving right to left and the light dimming half way.
+# Returns the frames and the position of the blob in every frame (None before it appears and once it has left)
+def synthetic_trial(frames=600, seed=0):
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(60, 200, (1080, 1440), dtype=np.uint8), (31, 31), 0)
+    trial = []
+    truth = []
+    for index in range(frames):
+        frame = background.astype(np.int16) + rng.integers(-4, 5, background.shape, dtype=np.int16)
+        if index >= frames // 2:
+            frame -= 20
+        blob = None
+        if index >= frames // 3:
+            blob = (int(1400 - (index - frames // 3) * 4), 540)
+            cv2.circle(frame, blob, blob_radius, 10, -1)
+            # Out of the arena on the left
+            if blob[0] + blob_radius <= 0:
+                blob = None
+        trial.append(np.clip(frame, 0, 255).astype(np.uint8))
+        truth.append(blob)
+    return trial, truth
+
+
+# Same processing as detect_motion() in Main_code.py, returns the mask and the centroid of the largest contour
+def find_motion(fg_mask):
+    fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
+    fg_mask = cv2.medianBlur(fg_mask, 5)
+    _, fg_mask = cv2.threshold(fg_mask, 127, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(fg_mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    areas = [cv2.contourArea(c) for c in contours]
+    if len(areas) == 0:
+        return fg_mask, None
+    max_index = np.argmax(areas)
+    if areas[max_index] <= min_contour_area:
+        return fg_mask, None
+    x, y, w, h = cv2.boundingRect(contours[max_index])
+    return fg_mask, (x + w / 2, y + h / 2)
+
+
+def run(frames, update_every):
+    model = Background_model.BackgroundModel(0, update_every=update_every)
+    model_times = []
+    total_times = []
+    results = []
+    for frame in frames:
+        start = perf_counter()
+        fg_mask = model.apply(frame)
+        applied = perf_counter()
+        results.append(find_motion(fg_mask))
+        end = perf_counter()
+        model_times.append(applied - start)
+        total_times.append(end - start)
+    return model, np.array(model_times) * 1000, np.array(total_times) * 1000, results
+
+
+def summary(times):
+    return {'mean_ms': round(float(times.mean()), 3), 'p95_ms': round(float(np.percentile(times, 95)), 3),
+            'max_ms': round(float(times.max()), 3)}
+
+
+def compare(reference, results, warmup):
+    agree = 0
+    errors = []
+    ious = []
+    for (ref_mask, ref_centroid), (mask, centroid) in list(zip(reference, results))[warmup:]:
+        agree += (ref_centroid is None) == (centroid is None)
+        if ref_centroid is not None and centroid is not None:
+            errors.append(np.hypot(ref_centroid[0] - centroid[0], ref_centroid[1] - centroid[1]))
+        union = cv2.countNonZero(cv2.bitwise_or(ref_mask, mask))
+        if union:
+            ious.append(cv2.countNonZero(cv2.bitwise_and(ref_mask, mask)) / union)
+    frames = max(1, len(results) - warmup)
+    return {
+        'detection_agreement': round(agree / frames, 4),
+        'centroid_error_px_mean': round(float(np.mean(errors)), 2) if errors else None,
+        'centroid_error_px_max': round(float(np.max(errors)), 2) if errors else None,
+        'mask_iou_mean': round(float(np.mean(ious)), 4) if ious else None,
+    }
+
+
+# Detection quality against the known blob of the synthetic trial
+def score(results, truth, warmup):
+    detected = 0
+    false_detections = 0
+    errors = []
+    ious = []
+    blob_mask = np.zeros(results[0][0].shape, np.uint8)
+    for (mask, centroid), blob in list(zip(results, truth))[warmup:]:
+        blob_mask[:] = 0
+        if blob is None:
+            false_detections += centroid is not None
+        else:
+            cv2.circle(blob_mask, blob, blob_radius, 255, -1)
+            if centroid is not None:
+                detected += 1
+                errors.append(np.hypot(blob[0] - centroid[0], blob[1] - centroid[1]))
+        union = cv2.countNonZero(cv2.bitwise_or(blob_mask, mask))
+        if union:
+            ious.append(cv2.countNonZero(cv2.bitwise_and(blob_mask, mask)) / union)
+    with_blob = sum(blob is not None for blob in truth[warmup:])
+    return {
+        'detection_rate': round(detected / max(1, with_blob), 4),
+        'false_detections': false_detections,
+        'frames_without_blob': len(truth[warmup:]) - with_blob,
+        'centroid_error_px_mean': round(float(np.mean(errors)), 2) if errors else None,
+        'centroid_error_px_max': round(float(np.max(errors)), 2) if errors else None,
+        'mask_iou_mean': round(float(np.mean(ious)), 4) if ious else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throttled background model updates")
+    parser.add_argument('trial', nargs='?', help="folder of a saved trial (frame_*_0.bmp), synthetic frames if left out")
+    parser.add_argument('--limit', type=int, default=None, help="only use the first N frames")
+    parser.add_argument('--update-every', type=int, default=Background_model.update_every)
+    parser.add_argument('--warmup', type=int, default=100, help="frames left out of the quality comparison")
+    parser.add_argument('--output', help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    # The position of the blob is only known for the synthetic arena
+    frames, truth = (load_trial(args.trial, args.limit), None) if args.trial else synthetic_trial()
+    _, full_model_ms, full_total_ms, reference = run(frames, 1)
+    model, model_ms, total_ms, results = run(frames, args.update_every)
+
+    report = {
+        'source': args.trial or 'synthetic',
+        'frames': len(frames),
+        'full_update': {'model': summary(full_model_ms), 'detection': summary(full_total_ms)},
+        'throttled': {'update_every': args.update_every, 'updates': model.updates, 'frozen': model.frozen,
+                      'model': summary(model_ms), 'detection': summary(total_ms)},
+        'speedup_model': round(float(full_model_ms.mean() / model_ms.mean()), 2),
+        'speedup_detection': round(float(full_total_ms.mean() / total_ms.mean()), 2),
+        'quality': compare(reference, results, args.warmup),
+    }
+    if truth is not None:
+        report['full_update']['truth'] = score(reference, truth, args.warmup)
+        report['throttled']['truth'] = score(results, truth, args.warmup)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
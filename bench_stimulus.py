@@ -0,0 +1,258 @@
+import argparse # python version
+import contextlib # python version
+import json # python version
+import os # python version
+import sys # python version
+import time # python version
+import numpy as np # 1.26.4
+# pygame's greeting would go to stdout, which is only the JSON
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame # 2.6.0
+import fake_board
+import IR_LED
+import Stim_bars
+import Video_stim
+import Visual_Stimulus_One_Bar
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# argparse, contextlib, json, os, sys, time: Python version
+# numpy: 1.26.4
+# pygame: 2.6.0
+
+# Frame time benchmark of the stimuli, no display or GPIO board needed.
+# Runs every stimulus mode under SDL's dummy (or offscreen) video driver with the fake board of fake_board.py:
+#   one_bar:  Visual_Stimulus_One_Bar.animation(), every speed and direction, LEDs on the pins of Main_code.py
+#   bars:     the animations of Video_stim.py through Stim_bars.play() (no LEDs, blank phases left out)
+# with the surface and / or the texture backend (Stim_renderer), and reports for every run:
+#   - render and flip time of every drawn frame (mean, 95th percentile, max) and the time between flips
+#   - frames drawn and missed, effective frame rate (from the median time between flips)
+#   - mean speed of the bars in px/s as drawn (position against flip time) and nominal (position of the compiled
+#     frames against their planned time), over the frames where a bar is whole on the screen
+#   - GPIO transactions of the fake board and lag of the LED commands
+# Usage:
+#   python bench_stimulus.py --output surface.json
+#   python bench_stimulus.py --backends texture --modes one_bar --duration 1
+# The results are printed as JSON (and written to --output if given), runs of two renderers can be compared
+# by mode, backend, speed and direction / stimulus.
+
+# Same pins as Main_code.py
+pin_names = ['C3', 'C2', 'C1', 'C0', 'C7', 'C6', 'C5', 'C4', 'D7', 'D6', 'D5', 'D4']
+
+
+def summary(times):
+    if len(times) == 0:
+        return None
+    return {'mean_ms': round(float(times.mean()), 3), 'p95_ms': round(float(np.percentile(times, 95)), 3),
+            'max_ms': round(float(times.max()), 3)}
+
+
+# Times every frame drawn by Visual_Stimulus_One_Bar.draw_rects (which Stim_bars uses too): render = drawing the
+# bars, flip = pygame.display.update / flip or TextureScreen.flip, time = Visual_Stimulus_One_Bar.flip_time
+class FrameRecorder:
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.render = []
+        self.flip = []
+        self.times = []
+        self.rects = []
+        self._flip = 0.0
+        self._patched = []
+
+    def _timed(self, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._flip += time.perf_counter() - start
+        return timed
+
+    def _patch(self, owner, name, replacement):
+        self._patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def __enter__(self):
+        draw_rects = Visual_Stimulus_One_Bar.draw_rects
+
+        def recorded(screen, rects, colors, background, sprites=None):
+            self._flip = 0.0
+            start = time.perf_counter()
+            draw_rects(screen, rects, colors, background, sprites)
+            total = time.perf_counter() - start
+            self.render.append(total - self._flip)
+            self.flip.append(self._flip)
+            self.times.append(Visual_Stimulus_One_Bar.flip_time)
+            self.rects.append([tuple(rect) for rect in rects])
+
+        self._patch(Visual_Stimulus_One_Bar, 'draw_rects', recorded)
+        if isinstance(self.screen, pygame.Surface):
+            self._patch(pygame.display, 'update', self._timed(pygame.display.update))
+            self._patch(pygame.display, 'flip', self._timed(pygame.display.flip))
+        else:
+            self._patch(self.screen, 'flip', self._timed(self.screen.flip))
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+
+# Mean speed (px/s) of the bars along the way they move, from their edges while they are inside the screen.
+# times: time of every frame, rects: (frames, bars, 4) clipped to the width x height screen. Only frames where the
+# bar has its full size across the way the edge moves count (not while it grows). A line is fitted to every stretch
+# of frames where an edge keeps moving the same way (frames at the ends of a stretch where it doesn't move are left out)
+def bar_speed(times, rects, width, height):
+    times = np.asarray(times, dtype=float)
+    rects = np.asarray(rects, dtype=float).reshape(len(times), -1, 4)
+    speeds = []
+    weights = []
+    for bar in range(rects.shape[1]):
+        left, top, bar_width, bar_height = rects[:, bar].T
+        edges = [(left, width, bar_height), (left + bar_width, width, bar_height),
+                 (top, height, bar_width), (top + bar_height, height, bar_width)]
+        for position, limit, across in edges:
+            inside = np.flatnonzero((position > 0) & (position < limit) & (across > 0) & (across == across.max()))
+            if len(inside) < 3:
+                continue
+            # Stretches: consecutive frames, same direction of movement
+            stretches = [[inside[0]]]
+            direction = 0
+            for previous, index in zip(inside[:-1], inside[1:]):
+                step = np.sign(position[index] - position[previous])
+                if index != previous + 1 or (step and direction and step != direction):
+                    stretches.append([])
+                    direction = 0
+                direction = step or direction
+                stretches[-1].append(index)
+            for stretch in stretches:
+                stretch = np.array(stretch)
+                moves = np.flatnonzero(np.diff(position[stretch]))
+                if len(moves) < 2:
+                    continue
+                stretch = stretch[moves[0]:moves[-1] + 2]
+                slope = np.polyfit(times[stretch], position[stretch], 1)[0]
+                speeds.append(abs(slope))
+                weights.append(len(stretch))
+    if not speeds:
+        return None
+    return float(np.average(speeds, weights=weights))
+
+
+def speed_report(nominal, realized):
+    report = {'nominal_px_s': None if nominal is None else round(nominal, 1),
+              'realized_px_s': None if realized is None else round(realized, 1), 'ratio': None}
+    if nominal and realized is not None:
+        report['ratio'] = round(realized / nominal, 4)
+    return report
+
+
+def frame_report(recorder, stats):
+    intervals = np.diff(recorder.times) * 1000
+    return {'frames': len(recorder.times), 'missed': stats.get('missed'), 'frame_rate_nominal': stats.get('frame_rate'),
+            'fps': round(1000 / float(np.median(intervals)), 2) if len(intervals) else None,
+            'render': summary(np.array(recorder.render) * 1000), 'flip': summary(np.array(recorder.flip) * 1000),
+            'frame_interval': summary(intervals)}
+
+
+def gpio_report(start_counts):
+    controller = fake_board.controller
+    executed = IR_LED.queue.pop_executed() if IR_LED.queue is not None else []
+    lag = np.array([command['lag'] for command in executed]) * 1000
+    return {'reads': controller.reads - start_counts[0], 'writes': controller.writes - start_counts[1],
+            'direction_writes': controller.direction_writes - start_counts[2],
+            'commands': len(executed), 'lag': summary(lag)}
+
+
+def run_one_bar(screen, backend, width, height, duration, color, board, speed, direction):
+    pins = [getattr(board, name) for name in pin_names]
+    pattern = {"Left": pins[4], "Right": pins[8], "Speed": [pins[5], pins[9]], "MD": [pins[10], pins[11]]}
+    if IR_LED.queue is not None:
+        IR_LED.queue.pop_executed()
+    controller = fake_board.controller
+    counts = (controller.reads, controller.writes, controller.direction_writes)
+    with FrameRecorder(screen) as recorder:
+        Visual_Stimulus_One_Bar.animation(duration, speed, direction, height, width, color, False, screen, pins, None, pattern=pattern)
+    IR_LED.queue.flush()
+    stats = Visual_Stimulus_One_Bar.frame_stats
+    sequence = Visual_Stimulus_One_Bar.compiled(duration, speed, direction, height, width, color, False)
+    nominal = bar_speed(np.arange(len(sequence['rects'])) / stats['frame_rate'], sequence['rects'], width, height)
+    return {'mode': 'one_bar', 'backend': backend, 'speed': speed, 'direction': direction, 'duration': duration,
+            **frame_report(recorder, stats), 'bar_speed': speed_report(nominal, bar_speed(recorder.times, recorder.rects, width, height)),
+            'gpio': gpio_report(counts)}
+
+
+def run_bars(screen, backend, width, height, name):
+    spec = {**Video_stim.spec_of(name), 'blank': 0}
+    colors = list(Video_stim.colors_three if spec['bars'] == 3 else Video_stim.colors_two)
+    controller = fake_board.controller
+    counts = (controller.reads, controller.writes, controller.direction_writes)
+    with FrameRecorder(screen) as recorder:
+        Stim_bars.play(spec, colors, screen, width, height)
+    stats = Stim_bars.frame_stats
+    sequence = Stim_bars.compiled(spec, width, height)
+    # Nominal from the frames play() draws (not the ones that look like the frame before)
+    drawn = np.flatnonzero(np.diff(sequence['changes'], prepend=0))
+    nominal = bar_speed(drawn / stats['frame_rate'], sequence['rects'][drawn], width, height)
+    return {'mode': 'bars', 'backend': backend, 'stimulus': name, **frame_report(recorder, stats),
+            'bar_speed': speed_report(nominal, bar_speed(recorder.times, recorder.rects, width, height)), 'gpio': gpio_report(counts)}
+
+
+def open_screen(backend, width, height):
+    if backend == 'texture':
+        import Stim_renderer
+        return Stim_renderer.TextureScreen(width, height)
+    return pygame.display.set_mode((width, height))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame time benchmark of the stimuli (headless)")
+    parser.add_argument('--modes', nargs='+', choices=['one_bar', 'bars'], default=['one_bar', 'bars'])
+    parser.add_argument('--backends', nargs='+', choices=['surface', 'texture'], default=['surface', 'texture'])
+    parser.add_argument('--driver', choices=['dummy', 'offscreen'], default='dummy', help="SDL video driver")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--duration', type=float, default=2, help="duration of the one bar stimulus (seconds)")
+    parser.add_argument('--output', help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    os.environ['SDL_VIDEODRIVER'] = args.driver
+    board = fake_board.install()
+    color = (255, 0, 0)
+    report = {'driver': args.driver, 'width': args.width, 'height': args.height,
+              'frame_rate': Visual_Stimulus_One_Bar.frame_rate, 'subpixel_steps': Visual_Stimulus_One_Bar.subpixel_steps,
+              'runs': []}
+    for backend in args.backends:
+        # The backgrounds and sprites belong to the screen of the backend
+        Visual_Stimulus_One_Bar.backgrounds.clear()
+        Visual_Stimulus_One_Bar.sprite_sets.clear()
+        Visual_Stimulus_One_Bar.bar_rects = []
+        Visual_Stimulus_One_Bar.shown = None
+        pygame.init()
+        screen = open_screen(backend, args.width, args.height)
+        # What the stimuli print goes to stderr, stdout is only the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            if 'one_bar' in args.modes:
+                Visual_Stimulus_One_Bar.prepare(args.duration, args.height, args.width, color, screen)
+                for speed in (0, 1, 2):
+                    for direction in ('left', 'right'):
+                        report['runs'].append(run_one_bar(screen, backend, args.width, args.height, args.duration, color,
+                                                          board, speed, direction))
+            if 'bars' in args.modes:
+                for name in Video_stim.stimuli:
+                    report['runs'].append(run_bars(screen, backend, args.width, args.height, name))
+        if backend == 'texture':
+            screen.close()
+        pygame.quit()
+    if IR_LED.queue is not None:
+        IR_LED.queue.stop()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, mode='w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
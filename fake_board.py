@@ -0,0 +1,131 @@
+import sys # python version
+import types # python version
+
+# OS Version: Ubuntu 22.04.4
+# Python: 3.10.12
+# sys, types: Python version
+
+# Fake board / digitalio backend that behaves like Blinka on the FT232H and counts the USB transactions,
+# so the GPIO code (IR_LED.py, the stimulus) can run and be measured without the board plugged in.
+# Usage (before anything imports board or digitalio):
+#   import fake_board
+#   fake_board.install()
+#   ...
+#   print(fake_board.controller.reads, fake_board.controller.writes)
+
+
+# Stands in for pyftdi's GpioMpsseController: one 16 bit port, every read / write is one USB transaction
+class FakeController:
+
+    def __init__(self):
+        self.direction = 0
+        self.output = 0
+        self.reads = 0
+        self.writes = 0
+        self.direction_writes = 0
+        self.log = []
+
+    def read(self, with_output=False):
+        self.reads += 1
+        return (self.output,)
+
+    def write(self, value):
+        self.writes += 1
+        self.output = value & self.direction
+        self.log.append(self.output)
+
+    def set_direction(self, pins, direction):
+        self.direction_writes += 1
+        self.direction = (self.direction & ~pins) | (direction & pins)
+
+    def transactions(self):
+        return self.reads + self.writes + self.direction_writes
+
+    def reset_counts(self):
+        self.reads = 0
+        self.writes = 0
+        self.direction_writes = 0
+        self.log = []
+
+
+controller = FakeController()
+
+
+# Like Blinka's MPSSE Pin: every value write is a read of the port + a write of the port
+class FakePin:
+
+    mpsse_gpio = controller
+
+    def __init__(self, pin_id, name):
+        self.id = pin_id
+        self.name = name
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+    # Same as Blinka, which makes the pins unhashable
+    def __eq__(self, other):
+        return self.id == other
+
+    __hash__ = None
+
+    def init_output(self):
+        controller.set_direction(1 << self.id, 1 << self.id)
+
+    def value(self, value=None):
+        if value is None:
+            return controller.read()[0] >> self.id & 1
+        current = controller.read(with_output=True)[0]
+        if value:
+            current |= 1 << self.id
+        else:
+            current &= ~(1 << self.id)
+        controller.write(current & controller.direction)
+
+
+class Direction:
+    INPUT = 'input'
+    OUTPUT = 'output'
+
+
+class DigitalInOut:
+
+    def __init__(self, pin):
+        self._pin = pin
+        self._direction = Direction.INPUT
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @direction.setter
+    def direction(self, direction):
+        self._direction = direction
+        if direction == Direction.OUTPUT:
+            self._pin.init_output()
+
+    @property
+    def value(self):
+        return bool(self._pin.value())
+
+    @value.setter
+    def value(self, value):
+        self._pin.value(bool(value))
+
+
+# FT232H pin ids: D4-D7 = 4-7, C0-C7 = 8-15
+names = {f"D{number}": number for number in range(4, 8)}
+names.update({f"C{number}": number + 8 for number in range(8)})
+
+
+# Puts the fake board and digitalio modules in place of the real ones
+def install():
+    board = types.ModuleType('board')
+    for name, pin_id in names.items():
+        setattr(board, name, FakePin(pin_id, name))
+    digitalio = types.ModuleType('digitalio')
+    digitalio.DigitalInOut = DigitalInOut
+    digitalio.Direction = Direction
+    sys.modules['board'] = board
+    sys.modules['digitalio'] = digitalio
+    return board